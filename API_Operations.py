@@ -1,11 +1,19 @@
-from fastapi import Depends, APIRouter, HTTPException, Path, Query # Import multiple classes from Fast-API package
+from fastapi import Depends, APIRouter, HTTPException, Path, Query, Request # Import multiple classes from Fast-API package
+from fastapi.responses import StreamingResponse # Import the streaming response class to send large listings in chunks
 from starlette import status # Import the status class to retrieve HTTP status codes
 from pydantic import BaseModel, Field # Import BaseModel and Field classes for data validation
-from sqlalchemy.orm import Session # Import Session class to establish a session between database and server
-from typing import Annotated # Import Annotated class to establish dependencies
-from Database import LocalSession # Import the LocalSession variable that contains the Session-Maker instance
+from sqlalchemy import select # Import the select function to build queries
+from typing import Annotated, Optional # Import Annotated class to establish dependencies and Optional class for filters that may be left unset
+from Database import db_dependency # Import the shared dependency that establishes a session to the database
 from Tables import Transaction # Import the Transaction table
 from Authentication import get_current_user # Import the function which retrieves information about the user
+from Pagination import account_type_pattern, transaction_query, read_page, stream_ndjson # Import the keyset pagination and streaming helpers
+from Balances import apply_delta, read_balances # Import the functions that maintain and read the per-user balances
+import Balances # Import the balances module that changes or deletes a record together with its balance
+from Ingest import UnsupportedUpload, read_rows, ingest # Import the functions that parse and insert bulk uploads
+from WriteQueue import run_write # Import the function that commits a write directly or through the group commit writer
+from Schemas import TransactionPage, BalanceResponse # Import the response models of the listings
+import Analytics # Import the analytics module whose snapshot is invalidated when a transaction changes
 
 
 router_object:APIRouter = APIRouter(
@@ -13,34 +21,44 @@ router_object:APIRouter = APIRouter(
     tags=["Operations"] # Tags to separate operations
 ) # API Router instance to establish a path between this module and the main file
 
-def db_connection() -> Session: # Function to establish connection to the database
-    connection = LocalSession() # Establish a local session to the database
-    try: yield connection # Hold the connection using yield-keyword until the response it sent
-    finally: connection.close() # Close the connection once the response has been sent
-
-db_dependency = Annotated[Session, Depends(db_connection)] # Dependency injection that waits for the Session is established by the function
 user_dependency = Annotated[dict, Depends(get_current_user)] # Dependency injection that waits for the current user information is retrieved as dictionary
 
 
 class TransactionRequest(BaseModel): # Request class that inherits from Base-Model for data validation
     amount:float = Field(gt=10.00, description="Current Amount in your Account!") # Field instance to set limits and constraints on input passed by client
-    account_type:str = Field(default='Checking', description="Type of Bank Account!") # Field instance with a default value and description outputted to the user
+    account_type:str = Field(default='Checking', pattern=account_type_pattern, description="Type of Bank Account!") # Field instance with a default value, the account types accepted by the Enum on the Transaction table, and description outputted to the user
 
 
-@router_object.get("/transactions", status_code=status.HTTP_200_OK) # GET Request to retrieve all transactions made by the current user from the database with a 200 OK response if successful
-async def get_all_transactions(user:user_dependency, db:db_dependency): # Accepts the data retrieved from current user and session to the database
+@router_object.get("/transactions", status_code=status.HTTP_200_OK, response_model=TransactionPage) # GET Request to retrieve a page of transactions made by the current user from the database with a 200 OK response if successful
+async def get_all_transactions(user:user_dependency, db:db_dependency, # Accepts the data retrieved from current user and session to the database
+                               after_id:int=Query(default=0, ge=0, description="Cursor returned as next_after_id by the previous page"), # Keyset cursor (0 starts from the first transaction)
+                               limit:int=Query(default=100, gt=0, le=1000, description="Transactions per page"), # Page size
+                               account_type:Optional[str]=Query(default=None, pattern=account_type_pattern), # Optional account type filter
+                               min_id:Optional[int]=Query(default=None, gt=0), max_id:Optional[int]=Query(default=None, gt=0)): # Optional ID range filter
     if user is None: # User is not authenticated (Token was not retrieved)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Credentials Invalid!") # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User has authenticated (Token and verification has been done)
-        return db.query(Transaction).filter(Transaction.owner_id == user.get('Username')).all() # Query the Transaction table and retrieve all the records
+        statement = transaction_query(user.get('Username'), account_type, min_id, max_id, after_id) # Query the Transaction table for the records of the current user after the cursor
+        return await read_page(db, statement, limit) # Retrieve one page of records and the cursor of the next page
+
+@router_object.get("/transactions/stream", status_code=status.HTTP_200_OK) # GET Request to stream every transaction made by the current user as newline-delimited JSON
+async def stream_transactions(user:user_dependency, # Accepts the data retrieved from current user (the stream opens its own session)
+                              chunk_size:int=Query(default=500, gt=0, le=10000, description="Transactions read per query"), # Rows read and sent per chunk
+                              account_type:Optional[str]=Query(default=None, pattern=account_type_pattern), # Optional account type filter
+                              min_id:Optional[int]=Query(default=None, gt=0), max_id:Optional[int]=Query(default=None, gt=0)): # Optional ID range filter
+    if user is None: # User is not authenticated (Token was not retrieved)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Credentials Invalid!") # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: # User has authenticated (Token and verification has been done)
+        rows = stream_ndjson(chunk_size, owner_id=user.get('Username'), account_type=account_type, min_id=min_id, max_id=max_id) # Generator that reads the records chunk by chunk
+        return StreamingResponse(rows, media_type='application/x-ndjson') # Send each chunk as soon as it is read so memory stays flat
 
 @router_object.get("/transactions/{transaction_id}", status_code=status.HTTP_200_OK) # GET Request to retrieve a record based on the ID passed as dynamic parameter with a 200 OK response if successful
 async def get_single_transaction(user:user_dependency, db:db_dependency, transaction_id:int=Path(gt=0)): # Accept the Session connection to the database and the ID passed as an argument that must be an integer and greater than 0
     if user is None: # User is not authenticated (Token was not retrieved)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Credentials Invalid") # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User has authenticated (Token and verification has been done)
-        transaction_record = (db.query(Transaction).filter(Transaction.id == transaction_id) #  Query the table and filter to retrieve a record with a matching ID passed
-                              .filter(Transaction.owner_id == user.get('Username')).first()) # The owner ID (Foreign Key) must match the username of the user passed in (Primary Key) and return the first record with the matching ID
+        transaction_record = (await db.execute(select(Transaction.owner_id, Transaction.amount).where(Transaction.id == transaction_id) #  Query only the two columns needed and filter to retrieve a record with a matching ID passed
+                                             .where(Transaction.owner_id == user.get('Username')))).first() # The owner ID (Foreign Key) must match the username of the user passed in (Primary Key) and return the first record with the matching ID
         if transaction_record is None: # No records were retrieved from the table
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction History Not Found!") # Raise HTTP-Exception with a status code of 404 (Not-Found) with a message
         else: return f'{transaction_record.owner_id} currently has {transaction_record.amount} dollars!' # Return the record with the matching ID
@@ -51,36 +69,46 @@ async def create_transaction(user:user_dependency ,db:db_dependency, transaction
     if user is None: # User is not authenticated (Token was not retrieved)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid User!") # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User has authenticated (Token and verification has been done)
-        transaction_record = Transaction( # Create transaction record instance
-            amount=transaction.amount, # Key-word argument to set amount column with data passed to the request-class instance by the user
-            account_type=transaction.account_type, # Key-word argument to set account-type column with data passed to the request-class instance by the user
-            owner_id = user.get("Username") # Use the dictionary returned by User-Dependency to retrieve his/her username (primary key on user's table) that is set as the foreign key
-        )
-        db.add(transaction_record) # Add the record to the table
-        db.commit() # Commit changes to the database
+        async def insert_transaction(session) -> None: # Write operation (committed on the request's session or by the group commit writer)
+            transaction_record = Transaction( # Create transaction record instance
+                amount=transaction.amount, # Key-word argument to set amount column with data passed to the request-class instance by the user
+                account_type=transaction.account_type, # Key-word argument to set account-type column with data passed to the request-class instance by the user
+                owner_id = user.get("Username") # Use the dictionary returned by User-Dependency to retrieve his/her username (primary key on user's table) that is set as the foreign key
+            )
+            session.add(transaction_record) # Add the record to the table
+            await apply_delta(session, transaction_record.owner_id, transaction_record.account_type, transaction_record.amount, 1) # Add the amount to the user's balance in the same database transaction
+        await run_write(db, insert_transaction) # Commit changes to the database
+
+@router_object.post("/bulk", status_code=status.HTTP_200_OK) # POST Request to create many records from a JSON array, NDJSON or CSV upload with a 200 OK response listing the rows that were rejected
+async def create_transactions(user:user_dependency, db:db_dependency, request:Request, batch_size:int=Query(default=500, gt=0, le=10000, description="Rows inserted per commit")): # Accept the current user, Session connection to the database, the raw upload, and the number of rows per commit
+    if user is None: # User is not authenticated (Token was not retrieved)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid User!") # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: # User has authenticated (Token and verification has been done)
+        try: return await ingest(db, user.get("Username"), read_rows(request), TransactionRequest, batch_size) # Validate every row, insert the valid ones in batches, and report the rest
+        except UnsupportedUpload as error: raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(error)) # Raise HTTP-Exception to indicate the upload format is not supported (415)
 
 @router_object.put("/transactions/", status_code=status.HTTP_204_NO_CONTENT) # PUT Request to update a record with a 204 OK response if successful to indicate record was updated to database
 async def update_transaction(user:user_dependency, db:db_dependency, transaction:TransactionRequest, transaction_id:int=Query(gt=0)): # Accept the database connection, TransactionRequest instance, and ID as a query parameter (/?id=value) that must be greater than 0
     if user is None: # User is not authenticated (Token was not retrieved)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid User!") # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User has authenticated (Token and verification has been done)
-        transaction_record = (db.query(Transaction).filter(Transaction.id == transaction_id) # Query the transaction table and filter the table to retrieve the record that matches the ID
-                              .filter(Transaction.owner_id == user.get('Username')).first) # The owner ID (Foreign Key) must match the username of the user passed in (Primary Key) and return the first record with the matching ID
-        if transaction_record is not None: # The matching record was successfully retrieved
-            transaction_record.amount = transaction.amount # Access the amount column and set it with the value on the request-instance passed by the client
-            transaction_record.account_type = transaction.account_type # Access the account-type column and set it with the value on the request-instance passed by the client
-            db.add(transaction_record) # Add the record to the table
-            db.commit() # Commit changes to the database
-        else: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction Not Found!") # Raise HTTP-Exception to indicate record was not found (404)
+        async def change_transaction(session) -> bool: return await Balances.update_transaction(session, transaction_id, user.get('Username'), transaction.amount, transaction.account_type) # Write operation that returns whether the record was found and updated
+        if not await run_write(db, change_transaction): # Commit changes to the database (nothing is written when the record was not found)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction Not Found!") # Raise HTTP-Exception to indicate record was not found (404)
+        Analytics.ledger_snapshot.invalidate() # The analytics snapshot still includes the previous amount
 
 @router_object.delete("/transactions/", status_code=status.HTTP_204_NO_CONTENT) # DELETE Request to delete a record with a 204 OK response if successful to indicate record was deleted from the database
 async def delete_transaction(user:user_dependency, db:db_dependency, transaction_id:int=Query(gt=0)): # Accept the database connection and ID as a query parameter (?/id=value) that must be greater than 0
     if user is None: # User is not authenticated (Token was not retrieved)
-        raise HTTPException(status_code=status.HTTP_401_NOT_AUTHORIZED, detail="Invalid User!")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid User!") # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User has authenticated (Token and verification has been done)
-        transaction_record = (db.query(Transaction).filter(Transaction.id == transaction_id) # Query the transaction table and filter the table to retrieve the record that matches the ID
-                              .filter(Transaction.owner_id == user.get('Username')).first()) # The owner ID (Foreign Key) must match the username of the user passed in (Primary Key) and return the first record with the matching ID
-        if transaction_record is not None: # The matching record was successfully retrieved
-            db.query(Transaction).filter(Transaction.id == transaction_id).filter(Transaction.owner_id == user.get('Username')).delete() # Delete the record from table
-            db.commit() # Commit changes to the database
-        else: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction Not Found!") # Raise HTTP-Exception to indicate record was not found (404)
\ No newline at end of file
+        async def remove_transaction(session) -> bool: return await Balances.delete_transaction(session, transaction_id, user.get('Username')) # Write operation that returns whether the record was found and deleted
+        if not await run_write(db, remove_transaction): # Commit changes to the database (nothing is written when the record was not found)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction Not Found!") # Raise HTTP-Exception to indicate record was not found (404)
+        Analytics.ledger_snapshot.invalidate() # The analytics snapshot still includes the deleted amount
+
+@router_object.get("/balances", status_code=status.HTTP_200_OK, response_model=list[BalanceResponse]) # GET Request to retrieve the current user's balance on each account type with a 200 OK response if successful
+async def get_balances(user:user_dependency, db:db_dependency): # Accepts the data retrieved from current user and session to the database
+    if user is None: # User is not authenticated (Token was not retrieved)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Credentials Invalid!") # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: return await read_balances(db, user.get('Username')) # Look up the maintained balances by primary key instead of summing the transactions
@@ -1,30 +1,46 @@
-from typing import Annotated # Import Annotated class to establish dependencies
-from sqlalchemy.orm import Session # Import Session class to establish a session between database and server
-from fastapi import APIRouter, Depends, HTTPException, Path # Import multiple classes from Fast-API package
+from typing import Annotated, Optional # Import Annotated class to establish dependencies and Optional class for filters that may be left unset
+from fastapi import APIRouter, Depends, HTTPException, Path, Query # Import multiple classes from Fast-API package
+from fastapi.responses import StreamingResponse # Import the streaming response class to send large listings in chunks
 from starlette import status # Import the status class to retrieve HTTP status codes
-from Database import LocalSession # Import the LocalSession variable that contains the Session-Maker instance
-from Authentication import get_current_user # Import the function which retrieves information about the logged-in user
+from sqlalchemy import select # Import the select function to build queries
+from Database import db_dependency # Import the shared dependency that establishes a session to the database
+import Authentication # Import the authentication module to report on its caches
+from Authentication import get_current_user, user_projection # Import the function which retrieves information about the logged-in user and the public columns of the User table
 from Tables import * # Import the User and Transaction tables from the database
+from Pagination import account_type_pattern, transaction_query, read_page, stream_ndjson # Import the keyset pagination and streaming helpers
+from Balances import delete_transaction, verify, rebuild # Import the functions that delete a record together with its balance, and verify and rebuild the per-user balances
+from Schemas import TransactionPage, AnalyticsReport, FlaggedUserPage # Import the response models of a page of transactions, of the portfolio report, and of a page of flagged users
+import Analytics # Import the analytics module whose snapshot is read by the report and invalidated by deletes
 
 admin_router:APIRouter = APIRouter(
     prefix="/Admin", # A new path for any API operations for administrators
     tags=["Administrator"] # # Tags to separate operations
 ) # API Router instance to establish a path between this module and the main file
 
-def get_database() -> Session: # Function to establish connection to the database
-    session = LocalSession() # Establish a local session to the database
-    try: yield session # Hold the connection using yield-keyword until the response it sent
-    finally: session.close() # Close the connection once the response has been sent
-
-
-db_dependency = Annotated[Session, Depends(get_database)] # Dependency injection that waits for the Session is established by the function
 user_dependency = Annotated[dict, Depends(get_current_user)] # Dependency injection that waits for the current user information is retrieved as dictionary
 
-@admin_router.get("/transaction", status_code=status.HTTP_200_OK) # GET Request to retrieve all transactions from the database with a 200 OK response if successful
-async def read_all(user: user_dependency, db:db_dependency): # Accepts the data retrieved from current user and session to the database
+@admin_router.get("/transaction", status_code=status.HTTP_200_OK, response_model=TransactionPage) # GET Request to retrieve a page of transactions from the database with a 200 OK response if successful
+async def read_all(user: user_dependency, db:db_dependency, # Accepts the data retrieved from current user and session to the database
+                   after_id:int=Query(default=0, ge=0, description="Cursor returned as next_after_id by the previous page"), # Keyset cursor (0 starts from the first transaction)
+                   limit:int=Query(default=100, gt=0, le=1000, description="Transactions per page"), # Page size
+                   owner_id:Optional[str]=Query(default=None, min_length=1), # Optional filter on the owner of the transactions
+                   account_type:Optional[str]=Query(default=None, pattern=account_type_pattern), # Optional account type filter
+                   min_id:Optional[int]=Query(default=None, gt=0), max_id:Optional[int]=Query(default=None, gt=0)): # Optional ID range filter
+    if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: return await read_page(db, transaction_query(owner_id, account_type, min_id, max_id, after_id), limit) # Query the Transaction table and retrieve one page of records from all users
+
+@admin_router.get("/transaction/stream", status_code=status.HTTP_200_OK) # GET Request to stream all transactions from the database as newline-delimited JSON
+async def stream_all(user: user_dependency, # Accepts the data retrieved from current user (the stream opens its own session)
+                     chunk_size:int=Query(default=500, gt=0, le=10000, description="Transactions read per query"), # Rows read and sent per chunk
+                     owner_id:Optional[str]=Query(default=None, min_length=1), # Optional filter on the owner of the transactions
+                     account_type:Optional[str]=Query(default=None, pattern=account_type_pattern), # Optional account type filter
+                     min_id:Optional[int]=Query(default=None, gt=0), max_id:Optional[int]=Query(default=None, gt=0)): # Optional ID range filter
     if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
-    else: db.query(Transaction).all() # Query the Transaction table and retrieve all the records from all users
+    else: # User is an administrator
+        rows = stream_ndjson(chunk_size, owner_id=owner_id, account_type=account_type, min_id=min_id, max_id=max_id) # Generator that reads the records chunk by chunk
+        return StreamingResponse(rows, media_type='application/x-ndjson') # Send each chunk as soon as it is read so memory stays flat
 
 
 @admin_router.delete('/transaction/{transaction_id}', status_code=status.HTTP_204_NO_CONTENT) # DELETE Request to delete a record with a 204 OK response if successful to indicate record was deleted from the database
@@ -32,9 +48,46 @@ async def delete(user:user_dependency, db:db_dependency, transaction_id: int=Pat
     if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
     else: # User is an administrator
-        transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first() # Retrieve the first record that matches the ID passed by the administrator as a path-argument
-        if transaction is None: # No transaction of the ID passed exist
+        if not await delete_transaction(db, transaction_id): # Delete the record and remove its amount from the owner's balance (nothing happens when no row was deleted)
+            await db.rollback() # End the transaction opened by the DELETE
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Transaction not found!') # Raise HTTP-Exception to indicate record was not found (404)
-        else: # Matching transaction found in database
-            db.query(Transaction).filter(Transaction.id == transaction_id).delete() # Delete the record from the table
-            db.commit() # Commit changes to the database
+        else: # Matching transaction was deleted
+            await db.commit() # Commit changes to the database
+            Analytics.ledger_snapshot.invalidate() # The analytics snapshot still includes the deleted amount
+
+@admin_router.post('/balances/verify', status_code=status.HTTP_200_OK) # POST Request to compare the maintained balances with the ledger (and optionally rebuild them) with a 200 OK response if successful
+async def verify_balances(user:user_dependency, db:db_dependency, rebuild_on_drift:bool=Query(default=False)): # Accept the database connection, information regarding current user, and whether drifted balances should be rebuilt
+    if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: # User is an administrator
+        drift = await verify(db) # Compare the stored balances with the balances recomputed from the ledger
+        if drift and rebuild_on_drift: await rebuild(db) # Recompute every balance from the ledger in bulk
+        return {'drift': drift, 'rebuilt': bool(drift) and rebuild_on_drift} # Return the balances that drifted and whether they were rebuilt
+
+@admin_router.get('/cache', status_code=status.HTTP_200_OK) # GET Request to retrieve the hit and miss counters of the authentication caches with a 200 OK response if successful
+async def cache_statistics(user:user_dependency): # Accept information regarding current user
+    if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: return {'token': Authentication.token_cache.statistics(), 'user': Authentication.user_cache.statistics()} # Return the size and counters of this worker's caches
+
+@admin_router.get('/analytics', status_code=status.HTTP_200_OK, response_model=AnalyticsReport) # GET Request to retrieve the totals, top owners and amount distribution of every transaction with a 200 OK response if successful
+async def analytics(user:user_dependency, db:db_dependency, # Accept information regarding current user and the database connection
+                    top:int=Query(default=10, gt=0, le=100, description="Owners with the largest totals to return"), # Size of the top owners list
+                    include_owners:bool=Query(default=False, description="Also return the totals of every owner")): # The full list grows with the number of users
+    if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: return await Analytics.read_analytics(db, top, include_owners) # Serve the snapshot, aggregating only the transactions added since its last refresh
+
+@admin_router.get('/flagged', status_code=status.HTTP_200_OK, response_model=FlaggedUserPage) # GET Request to retrieve a page of the users flagged by the background scan with a 200 OK response if successful
+async def flagged_users(user:user_dependency, db:db_dependency, # Accept information regarding current user and the database connection
+                        after:str=Query(default='', description="Cursor returned as next_after by the previous page"), # Keyset cursor on the username ('' starts from the first user)
+                        limit:int=Query(default=100, gt=0, le=1000, description="Users per page"), # Page size
+                        role:Optional[str]=Query(default=None, pattern='^(Admin|User)$')): # Optional role filter
+    if (user is None) or (user.get('Role') != 'Admin'): # No information retrieved from user or the user logged in is not an administrator
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Not an Administrator!') # Raise HTTP-Exception to indicate user is un-authorized (401)
+    else: # User is an administrator
+        statement = select(*user_projection).where(User.flagged == True).where(User.username > after).order_by(User.username) # Range scan of the (flagged, username) index instead of a full scan of the User table
+        if role is not None: statement = statement.where(User.role == role) # Restrict to one role
+        rows = (await db.execute(statement.limit(limit + 1))).all() # Read one extra row to learn whether another page exists
+        users = [row._asdict() for row in rows[:limit]] # Convert the rows of the page into dictionaries
+        return {'users': users, 'next_after': users[-1]['username'] if len(rows) > limit else None} # Return the page and the cursor (None on the last page)
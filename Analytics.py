@@ -0,0 +1,106 @@
+import asyncio # Import asyncio to serialize the refreshes of the snapshot
+import time # Import time module to decide when the snapshot is refreshed or rebuilt
+from collections import defaultdict # Import default dictionary to create aggregates on first use
+from sqlalchemy import select, func, case, type_coerce, String # Import the functions to build grouped queries, the bucket expression, and to read Enum columns as plain strings
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
+from Tables import Transaction # Import the Transaction table
+
+amount_buckets:tuple = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000) # Upper bounds of the amount histogram (the last bucket is +Inf)
+percentiles:tuple = (0.5, 0.9, 0.95, 0.99) # Percentiles of the amounts reported
+
+
+def bucket_expression(): # Function to build the SQL expression that returns the histogram bucket of each amount
+    return case(*((Transaction.amount <= bound, index) for index, bound in enumerate(amount_buckets)), else_=len(amount_buckets)) # First bucket whose bound is not below the amount (same rule as the metrics histograms)
+
+def aggregate_query(after_id:int): # Function to build the query that aggregates the transactions added after the ID passed
+    bucket = bucket_expression().label('bucket') # Histogram bucket of each amount
+    account_type = type_coerce(Transaction.account_type, String).label('account_type') # Read as a plain string so a value outside the Enum is reported as its own group instead of failing the query
+    return (select(Transaction.owner_id, account_type, bucket, func.sum(Transaction.amount).label('total'), func.count(Transaction.id).label('count'), # Sum and count of each group
+                   func.min(Transaction.amount).label('minimum'), func.max(Transaction.amount).label('maximum'), func.max(Transaction.id).label('last_id')) # Extremes of the amounts and the last ID seen
+            .where(Transaction.id > after_id).where(Transaction.amount.is_not(None)) # Keyset condition on the primary key so a refresh only reads the new rows (rows without an amount have nothing to report)
+            .group_by(Transaction.owner_id, account_type, bucket)) # One row per (owner, account type, bucket)
+
+def estimate_percentile(counts:list[int], total:int, fraction:float, minimum:float, maximum:float) -> float: # Function to estimate a percentile from the histogram by interpolating inside its bucket
+    rank = fraction * total # Number of amounts at or below the percentile
+    seen = 0 # Amounts in the buckets already passed
+    for index, count in enumerate(counts): # Every bucket in increasing order
+        if count and seen + count >= rank: # The percentile falls in this bucket
+            lower = max(minimum, amount_buckets[index - 1]) if index else minimum # Lower edge of the bucket (the smallest amount for the first one)
+            upper = min(maximum, amount_buckets[index]) if index < len(amount_buckets) else maximum # Upper edge of the bucket (the largest amount for +Inf)
+            return lower + (upper - lower) * (rank - seen) / count # Assume the amounts are spread evenly inside the bucket
+        seen += count # Move past the bucket
+    return maximum # Rounding left the rank above the last bucket
+
+
+class LedgerSnapshot: # Portfolio aggregates of the Transaction table, refreshed from the last transaction ID seen
+    def __init__(self, refresh_seconds:float=1.0, rebuild_seconds:float=300.0): # Accept how often new transactions are looked for and how often everything is recomputed
+        self.refresh_seconds = refresh_seconds # Requests within this many seconds of the last refresh are served without a query
+        self.rebuild_seconds = rebuild_seconds # Bounds how long changes made by another worker to existing transactions go unseen
+        self.lock:asyncio.Lock = asyncio.Lock() # Only one request refreshes at a time; the others wait for its result
+        self.reset() # Start empty
+        self.stale:bool = True # The first request builds the snapshot
+
+    def reset(self) -> None: # Forget every aggregate
+        self.last_id:int = 0 # Last transaction ID included
+        self.groups:dict = defaultdict(lambda: [0.0, 0]) # (owner, account type) -> [total, count]
+        self.buckets:list[int] = [0] * (len(amount_buckets) + 1) # Amounts per histogram bucket (the last one is +Inf)
+        self.minimum:float = float('inf') # Smallest amount
+        self.maximum:float = float('-inf') # Largest amount
+        self.refreshed_at:float = 0.0 # Time of the last refresh
+        self.rebuilt_at:float = 0.0 # Time of the last full rebuild
+        self.report:dict = {} # Report computed from the aggregates (recomputed only when they change)
+
+    def invalidate(self) -> None: self.stale = True # Existing transactions changed, so the next request recomputes everything
+
+    async def refresh(self, db:AsyncSession) -> dict: # Bring the snapshot up to date and return the report
+        async with self.lock: # Concurrent requests share one refresh
+            now = time.monotonic() # Current time
+            if self.stale or now - self.rebuilt_at > self.rebuild_seconds: # Existing transactions may have been updated or deleted
+                self.stale = False # Changes made while the rebuild runs mark it stale again
+                self.reset() # Recompute from the first transaction
+                self.rebuilt_at = now # Time of the rebuild
+            elif self.report and now - self.refreshed_at < self.refresh_seconds: return self.report # Recent enough: no query at all
+            try: rows = (await db.execute(aggregate_query(self.last_id))).all() # Aggregate only the transactions added since the last refresh
+            except Exception: # The query failed
+                self.stale = True # Do not serve a partial snapshot
+                raise # Let the caller report the error
+            for row in rows: # One row per (owner, account type, bucket) with new transactions
+                group = self.groups[(row.owner_id, row.account_type)] # Aggregate of the owner and account type
+                group[0] += row.total # Add the amounts
+                group[1] += row.count # Add the number of transactions
+                self.buckets[row.bucket] += row.count # Add them to their histogram bucket
+                self.minimum = min(self.minimum, row.minimum) # Smallest amount so far
+                self.maximum = max(self.maximum, row.maximum) # Largest amount so far
+                self.last_id = max(self.last_id, row.last_id) # The next refresh starts after the last ID seen
+            self.refreshed_at = now # Time of the refresh
+            if rows or not self.report: self.report = self.summarize() # Recompute the report only when something changed
+            return self.report # Return the report
+
+    def summarize(self) -> dict: # Compute the report from the aggregates
+        account_types:dict = defaultdict(lambda: [0.0, 0]) # account type -> [total, count]
+        owners:dict = defaultdict(lambda: [0.0, 0]) # owner -> [total, count]
+        for (owner_id, account_type), group in self.groups.items(): # Every (owner, account type) aggregate
+            for rollup, key in ((account_types, account_type), (owners, owner_id)): # Roll it up by account type and by owner
+                if key is None: continue # Rows without an account type or owner only count towards the overall figures
+                rollup[key][0] += group[0] # Add the amounts
+                rollup[key][1] += group[1] # Add the number of transactions
+        count = sum(self.buckets) # Number of transactions
+        total = sum(group[0] for group in self.groups.values()) # Sum of the amounts
+        return {'last_transaction_id': self.last_id, 'transactions': count, 'total': total, # Size of the ledger
+                'account_types': [{'account_type': name, 'total': value[0], 'count': value[1]} for name, value in sorted(account_types.items())], # Totals and counts per account type
+                'owners': sorted(({'owner_id': name, 'total': value[0], 'count': value[1]} for name, value in owners.items()), key=lambda owner: owner['total'], reverse=True), # Totals per owner, largest first
+                'amounts': {'count': count, 'minimum': self.minimum if count else None, 'maximum': self.maximum if count else None, 'mean': total / count if count else None, # Distribution of the amounts
+                            'buckets': [{'le': str(bound), 'count': value} for bound, value in zip(amount_buckets + ('+Inf',), self.buckets)], # Histogram (not cumulative)
+                            'percentiles': {f'p{round(fraction * 100)}': estimate_percentile(self.buckets, count, fraction, self.minimum, self.maximum) if count else None for fraction in percentiles}}} # Estimated from the histogram
+
+ledger_snapshot:LedgerSnapshot = LedgerSnapshot() # Snapshot of this process (each worker keeps its own)
+
+def configure_analytics(settings:Settings) -> None: # Function to build the snapshot from the settings
+    global ledger_snapshot # The snapshot is read by the Admin router and invalidated by the routes that change transactions
+    ledger_snapshot = LedgerSnapshot(settings.analytics_refresh_seconds, settings.analytics_rebuild_seconds) # Empty snapshot with the configured intervals
+
+async def read_analytics(db:AsyncSession, top:int, include_owners:bool) -> dict: # Function to return the portfolio report with the top owners (and optionally every owner)
+    report = await ledger_snapshot.refresh(db) # Up-to-date aggregates
+    owners = report['owners'] # Every owner, largest total first
+    return {**{key: value for key, value in report.items() if key != 'owners'}, 'owner_count': len(owners), 'top_owners': owners[:top], 'owner_totals': owners if include_owners else None} # Slice the cached list instead of querying
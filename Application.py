@@ -1,17 +1,72 @@
+from contextlib import asynccontextmanager # Import decorator to define the startup and shutdown steps of the application
+from typing import Optional # Import Optional class for settings that may be left unset
 from fastapi import FastAPI # Import Fast-API class to start up the server
-from Database import engine # Import database engine to create the database and tables in the database
+from fastapi.responses import ORJSONResponse # Import the response class that serializes with orjson instead of the standard JSON module
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError # Import the errors raised when another worker creates the same table or index first
+import Database # Import the database module whose engines are configured by the factory
 import Tables # Import tables in the database
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
+from Metrics import MetricsMiddleware, metrics_router, configure_metrics, instrument_engine # Import the request and SQL instrumentation
+from Hashing import configure_hashing # Import the function that builds the password hashing pool
+from WriteQueue import start_write_queue, stop_write_queue # Import the functions that start and stop the group commit writer
+from Analytics import configure_analytics # Import the function that builds the analytics snapshot
+from Flagging import start_flagging_scan, stop_flagging_scan # Import the functions that start and stop the background flagging scan
+from Authentication import router, configure_signing_key, configure_caches # Import the router to create a path to the Authentication file and the functions that install the signing key and size the caches
 from API_Operations import router_object # Import the router to create a path to the API file
-from Authentication import router # Import the router to create a path to the Authentication file
 from Admin import admin_router
 from User import user_router
 
 
-application:FastAPI = FastAPI() # Create an instance to FastAPI class to start the server
-application.include_router(router) # Include the router object of the Authentication operations
-application.include_router(router_object) # Include the router object imported for API operations
-application.include_router(user_router)
+def create_missing_indexes(connection) -> None: # Function to add the indexes defined in the Tables file to tables created before them
+    for table in Tables.Base.metadata.sorted_tables: # Every table
+        for index in table.indexes: index.create(bind=connection, checkfirst=True) # create_all skips the indexes of tables that already exist
 
-application.include_router(admin_router)
+async def create_schema() -> None: # Function to create all the tables defined in the Tables file
+    for attempt in range(2): # Workers started together can all find a table missing, and all but one fail to create it
+        try: # Try clause
+            async with Database.async_engine.begin() as connection: # Open a transaction on the asynchronous engine
+                await connection.run_sync(Tables.Base.metadata.create_all) # Create the tables that do not exist yet (existing tables are left untouched)
+                await connection.run_sync(create_missing_indexes) # Create the indexes added since an existing table was created
+            return # The schema is complete
+        except (OperationalError, ProgrammingError, IntegrityError): # "already exists" (or a duplicate catalog entry on PostgreSQL) from a concurrent worker
+            if attempt: raise # The second pass sees the tables created by the other worker, so a second failure is a real error
 
-Tables.Base.metadata.create_all(bind=engine) # Create all the tables defined in the file based on the engine passed to the arguments
\ No newline at end of file
+def create_application(settings:Optional[Settings]=None) -> FastAPI: # Application factory used by every worker process
+    settings = settings or Settings.from_environment() # Fall back to the environment when no settings are passed (uvicorn --factory)
+    Database.configure_database(settings) # Create the engines and connection pools from the settings
+    instrument_engine(Database.engine) # Time the statements of the blocking engine
+    instrument_engine(Database.async_engine.sync_engine) # Time the statements of the asynchronous engine
+    configure_metrics(settings.query_threshold, settings.slow_request_ms) # Set the thresholds of the query counter and slow-request log
+    configure_hashing(settings) # Build the password hashing pool
+    configure_caches(settings.token_cache_size, settings.user_cache_size, settings.user_cache_ttl) # Size the token and user caches
+    configure_signing_key(settings.secret_key) # Install the signing key shared by every worker
+    configure_analytics(settings) # Build the analytics snapshot with the configured intervals
+
+    @asynccontextmanager
+    async def lifespan(app:FastAPI): # Startup and shutdown steps run once per process instead of on import
+        try: # Startup and serving
+            if settings.create_schema: await create_schema() # Create the tables in the database on startup
+            start_write_queue(settings) # Start the group commit writer when it is enabled
+            start_flagging_scan(settings) # Start the background flagging scan when it is enabled
+            yield # Serve requests
+        finally: # Shutdown steps run even when startup or serving failed (each one even when the previous one failed)
+            try: await stop_flagging_scan() # Let the chunk in progress commit (through the writer when it is running)
+            finally: # Next shutdown step
+                try: await stop_write_queue() # Commit the writes still queued
+                finally: await Database.async_engine.dispose() # Close the pooled connections so no driver thread keeps the process alive
+
+    application:FastAPI = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse) # Create an instance to FastAPI class to start the server (JSON bodies are encoded by orjson)
+    application.add_middleware(MetricsMiddleware) # Record latency, status codes and statement counts of every request
+    application.include_router(metrics_router) # Include the router object that exposes the metrics
+    application.include_router(router) # Include the router object of the Authentication operations
+    application.include_router(router_object) # Include the router object imported for API operations
+    application.include_router(user_router)
+
+    application.include_router(admin_router)
+    return application # Return the configured application
+
+def __getattr__(name:str): # Module attribute hook that builds the default application on first access, so importing the factory configures nothing
+    global application # Cached once built
+    if name != 'application': raise AttributeError(f'module {__name__!r} has no attribute {name!r}') # Only the default application is built lazily
+    application = create_application() # Default application configured from the environment (uvicorn Application:application)
+    return application # Return the default application
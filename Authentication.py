@@ -2,16 +2,35 @@ from Tables import User # Import the User table
 from fastapi import APIRouter, Depends, HTTPException, Query # Import multiple classes from Fast-API package
 from starlette import status # Import the status class to retrieve HTTP status codes
 from typing import Annotated # Import Annotated class to establish dependencies
-from Database import LocalSession # Import the LocalSession variable that contains the Session-Maker instance
-from sqlalchemy.orm import Session # Import Session class to establish a session between database and server
+from Database import db_dependency # Import the shared dependency that establishes a session to the database
+from sqlalchemy import select, update # Import the select and update functions to build queries
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
 from pydantic import BaseModel, Field # Import BaseModel and Field classes for data validation
-from hashlib import sha512 # Import SHA-512 hashing algorithm
+from Hashing import hash_password, verify_password # Import the functions that hash and verify passwords off the event loop
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm # Import O-Auth token-bearer and request form classes to store and accept credentials
 from jose import jwt, JWTError # Import JASON Web Token (JWT) class and Error related to JWT
 from datetime import datetime, timedelta, timezone # Import Time, Date, and Timezone
 from Crypto.Random import get_random_bytes # Import function to generate random bytes
-
-secret_key = get_random_bytes(32) # Retrieve 32 random bytes which becomes secret
+from typing import Optional # Import Optional class for a signing key that may be left unset
+import warnings # Import warnings module to alert when tokens cannot be shared between workers
+from Cache import TTLCache # Import the bounded cache used for validated tokens and user records
+from Schemas import UserResponse, user_columns # Import the response model of a user and the columns it needs
+
+secret_key:bytes = get_random_bytes(32) # Retrieve 32 random bytes which becomes secret (replaced by configure_signing_key)
+token_cache:TTLCache = TTLCache(maxsize=10000) # Claims of validated tokens, each kept until its token expires
+user_cache:TTLCache = TTLCache(maxsize=10000, ttl=30.0) # User records keyed by username (read-through, invalidated when the record changes)
+
+def configure_caches(token_cache_size:int, user_cache_size:int, user_cache_ttl:float) -> None: # Function to size the authentication caches
+    global token_cache, user_cache # The caches are read by the functions in this module and invalidated by the User router
+    token_cache = TTLCache(maxsize=token_cache_size) # Token entries expire with the token itself
+    user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl) # User entries expire after the configured lifetime
+
+def configure_signing_key(key:Optional[str]) -> None: # Function to install the signing key shared by every worker and host
+    global secret_key # The key is read by the token functions in this module
+    if key is None: # No key was supplied by the deployment
+        warnings.warn('SECRET_KEY is not set; tokens are only valid on the process that issued them', RuntimeWarning) # Alert that multi-worker deployments will reject each other's tokens
+    else: secret_key = key.encode('utf-8') # Use the supplied key so every process signs and verifies with the same secret
+    token_cache.clear() # Tokens validated with the previous key must be checked again
 oauth2_bearer:OAuth2PasswordBearer = OAuth2PasswordBearer(tokenUrl="Authentication/login") # Create an instance of bearer token to accept client tokens
 
 
@@ -25,12 +44,6 @@ class Token(BaseModel): # Token Request class that inherits BaseModel for data v
     token_type: str # Store token type (JWT)
 
 
-def database_connection() -> Session: # Function to establish connection to the database
-    connection = LocalSession() # Establish a local session to the database
-    try: yield connection # Hold the connection using yield-keyword until the response is sent
-    finally: connection.close() # Close the connection once the response has been sent
-
-db_dependency = Annotated[Session, Depends(database_connection)] # Dependency injection that waits for the Session is established by the function
 oauth_dependency = Annotated[OAuth2PasswordRequestForm, Depends()] # Dependency inject that waits for the client to populate the request form
 bearer_dependency = Annotated[str, Depends(oauth2_bearer)] # Dependency inject that waits for bearer token to accept the token and return relevant information as a string
 
@@ -52,11 +65,26 @@ class UserRequest(BaseModel): # Request class that inherits from Base-Model for
         }
     }
 
-def verification(username:str, password:str, db:db_dependency): # Function to verify password
-    user_record = db.query(User).filter(User.username == username).first() # Query the database to retrieve first record with the matching username
+async def lookup_user(username:str, db:AsyncSession) -> Optional[dict]: # Function to retrieve a user record through the cache
+    user_record = user_cache.get(username) # Serve the record from memory when it is cached
+    if user_record is None: # Not cached (or expired)
+        row = (await db.execute(select(*User.__table__.columns).where(User.username == username))).first() # Query the database to retrieve first record with the matching username
+        if row is None: return None # Unknown usernames are not cached so a new user is visible immediately
+        user_record = row._asdict() # Keep a plain copy of the columns so it is not tied to the session
+        user_cache.set(username, user_record) # Cache the record for the following requests
+    return user_record # Return the record as a dictionary
+
+async def verification(username:str, password:str, db:AsyncSession): # Function to verify password
+    user_record = await lookup_user(username, db) # Retrieve the record with the matching username (from the cache when possible)
     if user_record is not None: # Record found in database
-        hashed_password = sha512(password.encode('utf-8')).digest().hex() # Use SHA-512 to hash the password passed to the function and retrieve the hexadecimal version
-        if user_record.hashed_password == hashed_password: return user_record # The hashed password stored in the record within the table matches the password passed to the function, thus record is returned back
+        matches, outdated = await verify_password(password, user_record['hashed_password']) # Check the password against the stored hash on the hashing pool
+        if matches and outdated: # Correct password stored with a legacy scheme (or outdated parameters)
+            hashed_password = await hash_password(password) # Hash the password with the current scheme
+            await db.execute(update(User).where(User.username == username).values(hashed_password=hashed_password)) # Replace the stored hash
+            await db.commit() # Commit changes to the database
+            user_record = {**user_record, 'hashed_password': hashed_password} # Copy of the record with the new hash
+            user_cache.set(username, user_record) # Keep the cache in line with the database
+        if matches: return user_record # The hashed password stored in the record within the table matches the password passed to the function, thus record is returned back
         else: return False # The password passed to function and password stored in table do not match
     else: return False # The record was not found in database
 
@@ -73,32 +101,37 @@ async def create_user(db:db_dependency, user:UserRequest): # Accept the Session
         last_name=user.last_name, # Key-word argument to set last-name column with data set on the request-class instance by the user
         email=user.email, # Key-word argument to set email column with data set on the request-class instance by the user
         username=user.username, # Key-word argument to set username column with data set on the request-class instance by the user
-        hashed_password=sha512(user.password.encode('utf-8')).digest().hex(), # Key-word argument to set password column by hashing (SHA 512 algorithm) the password set by the user on the request-instance
+        hashed_password=await hash_password(user.password), # Key-word argument to set password column by hashing (configured scheme, off the event loop) the password set by the user on the request-instance
         SSN=user.SSN, # Key-word argument to set SSN column with data set on the request-class instance by the user
         role=user.role # Key-word argument to set role column with data set on the request-class instance by the user
     )
     db.add(user) # Add record to the table
-    db.commit() # Commit changes to the database
+    await db.commit() # Commit changes to the database
+    user_cache.invalidate(user.username) # Drop any cached record under this username
+
+user_projection = tuple(getattr(User, column) for column in user_columns) # Columns of the User table returned to clients (the hashed password and SSN are never loaded)
 
-@router.get('/get_user', status_code=status.HTTP_200_OK) # GET Request to retrieve all users from the database with a 200 OK response if successful
-async def get_user(db:db_dependency): return db.query(User).all() # Query the User table and retrieve all the records
+@router.get('/get_user', status_code=status.HTTP_200_OK, response_model=list[UserResponse]) # GET Request to retrieve all users from the database with a 200 OK response if successful
+async def get_user(db:db_dependency): return [row._asdict() for row in (await db.execute(select(*user_projection)))] # Query only the public columns of the User table and retrieve all the records as plain rows
 
-@router.get('/get_user/', status_code=status.HTTP_200_OK) # GET Request to retrieve a record based on the SSN-ID passed as dynamic parameter with a 200 OK response if successful
+@router.get('/get_user/', status_code=status.HTTP_200_OK, response_model=UserResponse) # GET Request to retrieve a record based on the SSN-ID passed as dynamic parameter with a 200 OK response if successful
 async def get_SSN(db:db_dependency, ssn_input=Query(min_length=9, max_length=9)): # Accept the Session connection to the database and Query parameter that must be 9 digits long
-    record = db.query(User).filter(User.SSN == ssn_input).first() # Query the User table, filter the table to retrieve the record that matches the SSN passed, and return the first record with matching SSN
-    if record is not None: return record # Record found in table that is returned
+    record = (await db.execute(select(*user_projection).where(User.SSN == ssn_input))).first() # Query the public columns of the User table, filter the table to retrieve the record that matches the SSN passed, and return the first record with matching SSN
+    if record is not None: return record._asdict() # Record found in table that is returned
     else: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found") # Raise HTTP-Exception to indicate record was not found (404)
 
 @router.post('/login', response_model=Token) # POST Request to create a record with a response being a token-class
 async def login(db:db_dependency, form:oauth_dependency): # Accept the Session connection to database and request form
-    user_record = verification(form.username, form.password, db) # Verify the username and password entered into the form by the user
+    user_record = await verification(form.username, form.password, db) # Verify the username and password entered into the form by the user
     if not user_record: # User record not found
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect username or password') # Raise HTTP-Exception to indicate user is not authorized (401)
     else: # User record was found
-        token = create_access_token(user_record.username, user_record.SSN, user_record.role, expires_delta=timedelta(minutes=30)) # Create a JWT token that is valid for 30 minutes from now
+        token = create_access_token(user_record['username'], user_record['SSN'], user_record['role'], expires_delta=timedelta(minutes=30)) # Create a JWT token that is valid for 30 minutes from now
         return {'access_token': token, 'token_type': 'Bearer'} # Return the token that was Base64 encoded (Header.Payload.Signature) and type
 
 async def get_current_user(token:bearer_dependency): # Function that accepts the token sent by the client
+    claims = token_cache.get(token) # Tokens already validated are not decoded and verified again
+    if claims is not None: return claims # Return the cached username, SSN, and role
     try: # Try clause
         payload:dict = jwt.decode(token, secret_key, algorithms=['HS256']) # Decode the payload on token with the secret and algorithm used to encode it (returned as dictionary)
         username:str = payload.get('sub') # Retrieve the subject from the payload
@@ -106,5 +139,7 @@ async def get_current_user(token:bearer_dependency): # Function that accepts the
         user_role:str = payload.get('role')
         if username is None or ssn is None: # If either the subject or ID is not available
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Cannot Validate Credentials') # Raise HTTP-Exception to indicate user is not authorized (401) because it cannot be validated
-        else: return {'Username': username, 'SSN': ssn, 'Role': user_role} # Return the username, SSN, and role information from the decoded payload as a dictionary
+        claims = {'Username': username, 'SSN': ssn, 'Role': user_role} # Username, SSN, and role information from the decoded payload as a dictionary
+        if payload.get('exp') is not None: token_cache.set(token, claims, expires_at=payload['exp']) # Cache the claims until the token expires (tokens without an expiry are never cached)
+        return claims # Return the username, SSN, and role information from the decoded payload as a dictionary
     except JWTError: raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Cannot Validate Credentials') # Catch JWT error because it cannot be decoded
@@ -0,0 +1,94 @@
+import argparse # Import argument parser for the rebuild/verify command
+import asyncio # Import asyncio to run the command outside of the server
+from typing import Optional # Import Optional class for the owner filter that administrators leave unset
+from sqlalchemy import select, update, insert, delete, func, type_coerce, String # Import the functions to build queries and aggregates, and to read Enum columns as plain strings
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+import Database # Import the database module to open sessions for the command
+from Tables import Base, Transaction, Balance # Import the base class and the ledger and aggregate tables
+
+
+async def apply_delta(db:AsyncSession, owner_id:str, account_type:str, amount:float, count:int) -> None: # Function to add an amount and a transaction count to one balance inside the caller's transaction
+    statement = Database.upsert(Balance) # INSERT ... ON CONFLICT on SQLite and PostgreSQL
+    if statement is not None: # One atomic statement, so two first transactions on the same balance cannot both try to create it
+        statement = statement.values(owner_id=owner_id, account_type=account_type, total=amount, count=count) # Create the balance with the first transaction
+        await db.execute(statement.on_conflict_do_update(index_elements=[Balance.owner_id, Balance.account_type], # The balance already exists
+                                                         set_={'total': Balance.total + statement.excluded.total, 'count': Balance.count + statement.excluded.count})) # Increment it in place
+        return # Nothing else to do
+    result = await db.execute(update(Balance) # Other databases: increment the existing balance in place so concurrent writers cannot lose an update
+                              .where(Balance.owner_id == owner_id).where(Balance.account_type == account_type)
+                              .values(total=Balance.total + amount, count=Balance.count + count))
+    if result.rowcount == 0: # The user has no balance for this account type yet
+        await db.execute(insert(Balance).values(owner_id=owner_id, account_type=account_type, total=amount, count=count)) # Create the balance with the first transaction
+
+update_attempts:int = 3 # Times an update is retried when the row changed between the read and the write
+
+async def delete_transaction(db:AsyncSession, transaction_id:int, owner_id:Optional[str]=None) -> bool: # Function to delete a transaction and remove it from its balance inside the caller's transaction
+    statement = delete(Transaction).where(Transaction.id == transaction_id) # Delete the record with the matching ID
+    if owner_id is not None: statement = statement.where(Transaction.owner_id == owner_id) # Users may only delete their own records
+    removed = (await db.execute(statement.returning(Transaction.owner_id, type_coerce(Transaction.account_type, String).label('account_type'), Transaction.amount) # The deleted values come from the row the DELETE actually removed
+                                .execution_options(synchronize_session=False))).first() # No record of this session needs updating
+    if removed is None: return False # Nothing was deleted (missing, not owned, or deleted by a concurrent request)
+    await apply_delta(db, removed.owner_id, removed.account_type, -removed.amount, -1) # Remove the amount from the owner's balance
+    return True # The record was deleted
+
+async def update_transaction(db:AsyncSession, transaction_id:int, owner_id:str, amount:float, account_type:str) -> bool: # Function to change a transaction and move it between balances inside the caller's transaction
+    for attempt in range(update_attempts): # Retry when a concurrent request changed the row after it was read
+        current = (await db.execute(select(Transaction.amount, type_coerce(Transaction.account_type, String).label('account_type')) # Values the balances currently include
+                                    .where(Transaction.id == transaction_id).where(Transaction.owner_id == owner_id))).first() # The owner ID must match the username of the user
+        if current is None: return False # Nothing to update (missing, not owned, or deleted by a concurrent request)
+        changed = await db.execute(update(Transaction).where(Transaction.id == transaction_id).where(Transaction.owner_id == owner_id) # Update the record only if it still holds the values read
+                                   .where(Transaction.amount == current.amount).where(type_coerce(Transaction.account_type, String) == current.account_type)
+                                   .values(amount=amount, account_type=account_type).execution_options(synchronize_session=False))
+        if changed.rowcount == 1: # The values read are the ones replaced
+            await apply_delta(db, owner_id, current.account_type, -current.amount, -1) # Remove the previous amount from the user's balance
+            await apply_delta(db, owner_id, account_type, amount, 1) # Add the new amount to the balance of the (possibly new) account type
+            return True # The record was updated
+    return False # The row kept changing under the update (reported like a missing record)
+
+async def read_balances(db:AsyncSession, owner_id:str) -> list[dict]: # Function to read the balances of one user by primary key
+    rows = (await db.execute(select(Balance.account_type, Balance.total, Balance.count).where(Balance.owner_id == owner_id))).all() # At most one row per account type
+    return [row._asdict() for row in rows] # Return the balances as dictionaries
+
+def ledger_totals(): # Function to build the query that recomputes every balance from the Transaction table
+    return (select(Transaction.owner_id, Transaction.account_type, func.sum(Transaction.amount).label('total'), func.count(Transaction.id).label('count'))
+            .where(Transaction.owner_id.is_not(None)).where(Transaction.account_type.is_not(None)) # Rows without an owner or account type cannot be attributed to a balance
+            .group_by(Transaction.owner_id, Transaction.account_type)) # One row per (owner, account type)
+
+async def verify(db:AsyncSession, tolerance:float=1e-6) -> list[dict]: # Function to compare the stored balances with the ledger and return every balance that drifted
+    expected = {(row.owner_id, row.account_type): (row.total, row.count) for row in (await db.execute(ledger_totals())).all()} # Balances recomputed from the ledger
+    stored = {(row.owner_id, row.account_type): (row.total, row.count) for row in (await db.execute(select(Balance.owner_id, Balance.account_type, Balance.total, Balance.count))).all()} # Balances maintained incrementally
+    drift:list[dict] = [] # Balances that do not match
+    for key in expected.keys() | stored.keys(): # Every balance present on either side
+        expected_total, expected_count = expected.get(key, (0.0, 0)) # A missing ledger entry means the balance should be empty
+        stored_total, stored_count = stored.get(key, (0.0, 0)) # A missing stored balance means it was never maintained
+        if abs(expected_total - stored_total) > tolerance or expected_count != stored_count: # Totals are floats so they are compared within a tolerance
+            drift.append({'owner_id': key[0], 'account_type': key[1], 'expected_total': expected_total, 'stored_total': stored_total, 'expected_count': expected_count, 'stored_count': stored_count})
+    return drift # Return the balances that drifted (empty when everything matches)
+
+async def rebuild(db:AsyncSession) -> None: # Function to recompute every balance from the ledger in bulk
+    await db.execute(delete(Balance)) # Remove the stored balances
+    await db.execute(insert(Balance).from_select(['owner_id', 'account_type', 'total', 'count'], ledger_totals())) # Insert the recomputed balances with one INSERT ... SELECT
+    await db.commit() # Commit changes to the database
+
+
+async def main(arguments:argparse.Namespace) -> int: # Command entry point that verifies (and optionally rebuilds) the balances
+    Database.ensure_database() # Create the engines from the environment
+    async with Database.async_engine.begin() as connection: await connection.run_sync(Base.metadata.create_all) # Make sure the Balance table exists
+    session = Database.open_session() # Establish a session in the configured mode
+    try: # Try clause
+        drift = await verify(session) # Compare the stored balances with the ledger
+        for entry in drift: print(entry) # Report every balance that drifted
+        print(f'{len(drift)} balance(s) drifted from the ledger') # Summary line
+        if drift and arguments.rebuild: # Drift was found and the caller asked for a rebuild
+            await rebuild(session) # Recompute every balance from the ledger
+            print('Balances rebuilt from the ledger') # Confirm the rebuild
+            return 0 # The balances match the ledger again
+        return 1 if drift else 0 # Non-zero exit status when drift remains
+    finally: # Release the database resources once the command has finished
+        await session.close() # Close the connection
+        await Database.async_engine.dispose() # Close the pooled connections before the event loop stops
+
+if __name__ == '__main__': # Run as a command: python Balances.py [--rebuild]
+    parser = argparse.ArgumentParser(description='Verify the Balance table against the Transaction ledger') # Command line parser
+    parser.add_argument('--rebuild', action='store_true', help='Recompute every balance from the ledger when drift is found') # Optional rebuild
+    raise SystemExit(asyncio.run(main(parser.parse_args()))) # Exit with the status returned by the command
@@ -0,0 +1,69 @@
+import argparse # Import argument parser for the benchmark options
+import asyncio # Import asyncio to simulate concurrent logins
+import json # Import JSON module to write the results
+import os # Import OS module to make the repository importable when run as a script
+import sys # Import sys module to make the repository importable when run as a script
+import time # Import time module to measure latency and throughput
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Run from anywhere: python Benchmarks/Password_Hashing.py
+from Hashing import HashingPool, create_hasher # Import the hashing pool and the factory of hashers
+
+
+def percentile(samples:list[float], fraction:float) -> float: # Function to return the value below which the fraction passed of the samples fall
+    ordered = sorted(samples) # Samples in increasing order
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] # Nearest-rank percentile
+
+async def measure(hasher_name:str, workers:int, executor:str, logins:int, concurrency:int, rounds:int) -> dict: # Function to simulate a burst of logins against one hasher and pool size
+    pool = HashingPool(create_hasher(hasher_name, rounds), workers, executor) # Pool under test
+    stored = await pool.hash('Password') # Hash stored for the simulated user
+    latencies:list[float] = [] # Seconds taken by each login
+    lag:list[float] = [] # Event-loop delay observed while the logins run
+    gate = asyncio.Semaphore(concurrency) # Clients logging in at the same time
+
+    async def login() -> None: # One simulated login
+        async with gate: # Wait for a client slot
+            started = time.perf_counter() # Start of the login
+            matches, outdated = await pool.verify('Password', stored) # Verify the password on the pool
+            latencies.append(time.perf_counter() - started) # Record the latency
+            assert matches # The benchmark only measures successful logins
+
+    async def probe(done:asyncio.Event) -> None: # Measures how late the event loop wakes up (a blocked loop shows up here)
+        while not done.is_set(): # Until every login has finished
+            started = time.perf_counter() # Time the sleep was requested
+            await asyncio.sleep(0.001) # Ask to wake up after one millisecond
+            lag.append(time.perf_counter() - started - 0.001) # Extra delay caused by blocking work
+
+    done = asyncio.Event() # Set when the logins have finished
+    prober = asyncio.create_task(probe(done)) # Start measuring the event loop
+    started = time.perf_counter() # Start of the burst
+    await asyncio.gather(*(login() for _ in range(logins))) # Run the burst
+    elapsed = time.perf_counter() - started # Duration of the burst
+    done.set() # Stop measuring the event loop
+    await prober # Wait for the probe to finish
+    pool.shutdown() # Stop the workers
+    return {'hasher': hasher_name, 'executor': executor, 'workers': workers, 'logins': logins, 'concurrency': concurrency, # Configuration of the run
+            'logins_per_second': logins / elapsed, 'p50_ms': percentile(latencies, 0.50) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000, # Throughput and latency
+            'max_loop_lag_ms': max(lag, default=0.0) * 1000} # Longest event-loop stall
+
+async def main(arguments:argparse.Namespace) -> list[dict]: # Run every combination of hasher and pool size
+    results:list[dict] = [] # One entry per combination
+    for hasher_name in arguments.hashers: # Every hasher requested
+        for workers in arguments.workers: # Every pool size requested
+            result = await measure(hasher_name, workers, arguments.executor, arguments.logins, arguments.concurrency, arguments.rounds) # Run the burst
+            print(f"{result['hasher']:>7} {result['executor']:>7} workers={workers:<3} {result['logins_per_second']:>10.1f} logins/s  p50={result['p50_ms']:>8.2f} ms  p99={result['p99_ms']:>8.2f} ms  loop lag={result['max_loop_lag_ms']:>7.2f} ms") # One line per combination
+            results.append(result) # Keep the result for the JSON output
+    return results # Return every result
+
+if __name__ == '__main__': # Run as a command: python Benchmarks/Password_Hashing.py --hashers sha512 bcrypt --workers 1 2 4 8
+    parser = argparse.ArgumentParser(description='Logins per second and p99 latency for each password hasher and pool size') # Command line parser
+    parser.add_argument('--hashers', nargs='+', default=['sha512', 'bcrypt'], choices=['sha512', 'bcrypt']) # Hashers to compare
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, 8]) # Pool sizes to compare
+    parser.add_argument('--executor', default='thread', choices=['thread', 'process']) # Kind of executor
+    parser.add_argument('--logins', type=int, default=200) # Logins per burst
+    parser.add_argument('--concurrency', type=int, default=50) # Clients logging in at the same time
+    parser.add_argument('--rounds', type=int, default=12) # bcrypt cost factor
+    parser.add_argument('--output', help='Write the results to this JSON file') # Optional JSON output
+    arguments = parser.parse_args() # Parse the options
+    results = asyncio.run(main(arguments)) # Run the benchmark
+    if arguments.output: # JSON output requested
+        with open(arguments.output, 'w') as file: json.dump(results, file, indent=2) # Write the results
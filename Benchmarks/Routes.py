@@ -0,0 +1,183 @@
+import argparse # Import argument parser for the benchmark options
+import asyncio # Import asyncio to drive the routes concurrently
+import json # Import JSON module to write and compare the results
+import os # Import OS module to locate the repository and the temporary database
+import platform # Import platform module to record the interpreter in the results
+import random # Import random module to seed the database
+import resource # Import resource module to read the peak resident memory of the process
+import subprocess # Import subprocess module to record the commit being measured
+import sys # Import sys module to make the repository importable when run as a script
+import tempfile # Import tempfile module to create the temporary database
+import time # Import time module to measure latency and throughput
+import tracemalloc # Import tracemalloc module to measure the peak Python allocation of each route
+from collections import Counter # Import counter to tally the status codes
+from datetime import datetime, timedelta, timezone # Import Time, Date, and Timezone
+from typing import Callable, NamedTuple # Import the types of the scenarios
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Root of the repository
+sys.path.insert(0, repository) # Run from anywhere: python Benchmarks/Routes.py
+import httpx # Import the HTTP client that calls the application in-process
+from sqlalchemy import insert # Import the insert function to seed the database in bulk
+import Database # Import the database module to seed through the configured engine
+import Tables # Import the tables to seed
+from Configuration import Settings # Import the settings class used to build the application
+from Application import create_application # Import the application factory
+from Authentication import create_access_token # Import the function that issues tokens for the seeded users
+from Balances import rebuild # Import the function that computes the balances of the seeded transactions
+from Hashing import create_hasher # Import the factory of hashers to store the seeded passwords
+
+account_types:tuple = ('Checking', 'Credit', 'Savings') # Account types accepted by the Transaction table
+routers:tuple = ('/Authentication', '/API_Operations', '/About-User', '/Admin') # Routers covered by the suite
+
+
+class Scenario(NamedTuple): # One route driven by the benchmark
+    name:str # Label of the route in the results
+    route:str # Route template (used to report routes without a scenario)
+    build:Callable[[int], tuple] # Function that returns (method, url, keyword arguments) for the i-th request
+
+
+def percentile(samples:list[float], fraction:float) -> float: # Function to return the value below which the fraction passed of the samples fall
+    ordered = sorted(samples) # Samples in increasing order
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0 # Nearest-rank percentile
+
+def commit_id() -> str: # Function to return the commit being measured
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repository, capture_output=True, text=True, check=True).stdout.strip() # Short commit hash
+    except (OSError, subprocess.CalledProcessError): return 'unknown' # Not a git checkout
+
+
+async def seed(arguments:argparse.Namespace) -> list[str]: # Function to fill the database with users and transactions and return the usernames
+    hashed_password = create_hasher(arguments.hasher, arguments.bcrypt_rounds).hash('Password') # Every seeded user has the same password (hashed once)
+    usernames = [f'user{number}' for number in range(arguments.users)] # Seeded usernames
+    users = [{'first_name': 'Bench', 'last_name': str(number), 'email': f'user{number}@bench.local', 'username': username, 'hashed_password': hashed_password, # User rows
+              'SSN': f'{100000000 + number:09d}', 'role': 'Admin' if number == 0 else 'User', 'flagged': False} for number, username in enumerate(usernames)]
+    generator = random.Random(arguments.seed) # Reproducible amounts and account types
+    transactions = [{'amount': round(generator.uniform(10.01, 5000), 2), 'account_type': generator.choice(account_types), 'owner_id': usernames[number % len(usernames)]} # Transaction n belongs to user n % users
+                    for number in range(arguments.transactions)]
+    session = Database.open_session() # Seed through the engine the application uses
+    try: # Try clause
+        await session.execute(insert(Tables.User), users) # Insert the users with one executemany
+        for start in range(0, len(transactions), 10000): await session.execute(insert(Tables.Transaction), transactions[start:start + 10000]) # Insert the transactions in batches
+        await session.commit() # Commit the seed data
+        await rebuild(session) # Compute the balances of the seeded transactions
+    finally: await session.close() # Close the connection
+    return usernames # Return the seeded usernames
+
+
+def scenarios(arguments:argparse.Namespace, usernames:list[str]) -> list[Scenario]: # Function to build the requests sent to every route
+    expires = timedelta(hours=1) # Tokens outlive the benchmark
+    tokens = {name: create_access_token(name, f'{100000000 + number:09d}', 'Admin' if number == 0 else 'User', expires) for number, name in enumerate(usernames)} # Token of every seeded user
+    def headers(number:int) -> dict: return {'Authorization': f'Bearer {tokens[usernames[number % len(usernames)]]}'} # Requests are spread over the seeded users
+    admin = {'Authorization': f'Bearer {tokens[usernames[0]]}'} # The first seeded user is an administrator
+    owned = lambda number: number % len(usernames) # Index of the owner of transaction number + 1
+    total, requests = arguments.transactions, arguments.requests # Seeded transactions and requests per route
+    delete_start = total - 2 * requests # Transactions deleted by the users (the admin deletes the ones after them)
+    bulk_rows = [{'amount': 25.0, 'account_type': 'Savings'}] * arguments.bulk_rows # Rows of each bulk upload
+    return [ # Read-only routes first, then writes, then deletes (deleted IDs are disjoint from the ones read and updated)
+        Scenario('auth.get_user_by_ssn', '/Authentication/get_user/', lambda i: ('GET', '/Authentication/get_user/', {'params': {'ssn_input': f'{100000000 + i % len(usernames):09d}'}})),
+        Scenario('auth.get_all_users', '/Authentication/get_user', lambda i: ('GET', '/Authentication/get_user', {})),
+        Scenario('auth.login', '/Authentication/login', lambda i: ('POST', '/Authentication/login', {'data': {'username': usernames[i % len(usernames)], 'password': 'Password'}})),
+        Scenario('operations.list_page', '/API_Operations/transactions', lambda i: ('GET', '/API_Operations/transactions', {'headers': headers(i), 'params': {'limit': 100}})),
+        Scenario('operations.stream', '/API_Operations/transactions/stream', lambda i: ('GET', '/API_Operations/transactions/stream', {'headers': headers(i)})),
+        Scenario('operations.get_one', '/API_Operations/transactions/{transaction_id}', lambda i: ('GET', f'/API_Operations/transactions/{i % total + 1}', {'headers': headers(owned(i % total))})),
+        Scenario('operations.balances', '/API_Operations/balances', lambda i: ('GET', '/API_Operations/balances', {'headers': headers(i)})),
+        Scenario('profile.get', '/About-User/user', lambda i: ('GET', '/About-User/user', {'headers': headers(i)})),
+        Scenario('admin.list_page', '/Admin/transaction', lambda i: ('GET', '/Admin/transaction', {'headers': admin, 'params': {'limit': 100, 'after_id': i * 100 % total}})),
+        Scenario('admin.stream', '/Admin/transaction/stream', lambda i: ('GET', '/Admin/transaction/stream', {'headers': admin})),
+        Scenario('admin.cache', '/Admin/cache', lambda i: ('GET', '/Admin/cache', {'headers': admin})),
+        Scenario('admin.analytics', '/Admin/analytics', lambda i: ('GET', '/Admin/analytics', {'headers': admin, 'params': {'top': 10}})),
+        Scenario('admin.flagged', '/Admin/flagged', lambda i: ('GET', '/Admin/flagged', {'headers': admin, 'params': {'limit': 100}})),
+        Scenario('admin.verify_balances', '/Admin/balances/verify', lambda i: ('POST', '/Admin/balances/verify', {'headers': admin})),
+        Scenario('auth.create_user', '/Authentication/create_user', lambda i: ('POST', '/Authentication/create_user', {'json': {'first_name': 'New', 'last_name': str(i), 'email': f'new{i}@bench.local', 'username': f'new{i}', 'password': 'Password', 'SSN': f'{900000000 + i:09d}', 'role': 'User'}})),
+        Scenario('operations.create', '/API_Operations/', lambda i: ('POST', '/API_Operations/', {'headers': headers(i), 'json': {'amount': 42.0, 'account_type': account_types[i % 3]}})),
+        Scenario('operations.bulk', '/API_Operations/bulk', lambda i: ('POST', '/API_Operations/bulk', {'headers': headers(i), 'json': bulk_rows})),
+        Scenario('operations.update', '/API_Operations/transactions/', lambda i: ('PUT', '/API_Operations/transactions/', {'headers': headers(owned(i % delete_start)), 'params': {'transaction_id': i % delete_start + 1}, 'json': {'amount': 99.0, 'account_type': 'Credit'}})),
+        Scenario('profile.update_password', '/About-User/user/password', lambda i: ('PUT', '/About-User/user/password', {'headers': headers(i), 'json': {'password': 'Password', 'new_password': 'Password'}})),
+        Scenario('operations.delete', '/API_Operations/transactions/', lambda i: ('DELETE', '/API_Operations/transactions/', {'headers': headers(owned(delete_start + i)), 'params': {'transaction_id': delete_start + i + 1}})),
+        Scenario('admin.delete', '/Admin/transaction/{transaction_id}', lambda i: ('DELETE', f'/Admin/transaction/{delete_start + requests + i + 1}', {'headers': admin})),
+    ]
+
+
+async def drive(client:httpx.AsyncClient, scenario:Scenario, requests:int, concurrency:int, trace_memory:bool) -> dict: # Function to send the requests of one scenario and measure them
+    latencies:list[float] = [] # Seconds taken by each request
+    statuses:Counter = Counter() # Responses per status code
+    numbers = iter(range(requests)) # Request numbers shared by the clients
+
+    async def worker() -> None: # One client sending requests one after another
+        for number in numbers: # Take the next request number
+            method, url, options = scenario.build(number) # Request to send
+            started = time.perf_counter() # Start of the request
+            response = await client.request(method, url, **options) # Send it (the body is read in full, streams included)
+            latencies.append(time.perf_counter() - started) # Record the latency
+            statuses[response.status_code] += 1 # Tally the status code
+
+    if trace_memory: tracemalloc.reset_peak() # Measure the peak of this scenario only
+    started = time.perf_counter() # Start of the scenario
+    await asyncio.gather(*(worker() for _ in range(concurrency))) # Run the clients
+    elapsed = time.perf_counter() - started # Duration of the scenario
+    result = {'scenario': scenario.name, 'requests': requests, 'concurrency': concurrency, 'requests_per_second': requests / elapsed, # Throughput
+              'p50_ms': percentile(latencies, 0.50) * 1000, 'p95_ms': percentile(latencies, 0.95) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000, # Latency
+              'statuses': {str(code): count for code, count in sorted(statuses.items())}, # Status codes (anything but 2xx points at a broken scenario)
+              'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024} # Peak resident memory of the process so far (Linux reports kilobytes)
+    if trace_memory: result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20 # Peak Python allocation during the scenario
+    return result # Return the measurements
+
+
+async def main(arguments:argparse.Namespace) -> dict: # Build the application, seed it, and drive every scenario
+    if arguments.transactions < 2 * arguments.requests + 1: raise SystemExit('--transactions must be more than twice --requests (the delete scenarios need their own rows)') # Deleted IDs must exist
+    directory = tempfile.mkdtemp(prefix='bank-benchmark-') # Temporary database location
+    link = 'sqlite:///:memory:' if arguments.memory else f'sqlite:///{os.path.join(directory, "bench.db")}' # In-memory or temporary file database
+    settings = Settings(secret_key='benchmark', database_url=link, database_mode=arguments.mode, write_coalescing=arguments.coalesce, # Configuration under test
+                        password_hasher=arguments.hasher, bcrypt_rounds=arguments.bcrypt_rounds, pool_size=arguments.pool_size, hash_workers=arguments.hash_workers, flag_scan=arguments.flag_scan)
+    application = create_application(settings) # Application under test
+    async with application.router.lifespan_context(application): # Run the startup steps (schema, writer task) as the server would
+        if arguments.mode == 'sync': Tables.Base.metadata.create_all(bind=Database.engine) # An in-memory database is private to each engine
+        usernames = await seed(arguments) # Seed the database
+        if arguments.trace_memory: tracemalloc.start() # Track Python allocations
+        suite = [scenario for scenario in scenarios(arguments, usernames) if not arguments.only or any(name in scenario.name for name in arguments.only)] # Scenarios to run
+        covered = {scenario.route for scenario in scenarios(arguments, usernames)} # Routes with a scenario
+        for route in application.routes: # Report routes added without a scenario so the suite keeps up with the routers
+            if getattr(route, 'path', '').startswith(routers) and route.path not in covered: print(f'warning: no scenario for {route.path}', file=sys.stderr)
+        transport = httpx.ASGITransport(app=application) # Call the application in-process
+        results:list[dict] = [] # One entry per scenario
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client: # In-process client
+            for scenario in suite: # Every scenario in order
+                result = await drive(client, scenario, arguments.requests, arguments.concurrency, arguments.trace_memory) # Measure the scenario
+                print(f"{result['scenario']:<26} {result['requests_per_second']:>9.1f} req/s  p50={result['p50_ms']:>8.2f}  p95={result['p95_ms']:>8.2f}  p99={result['p99_ms']:>8.2f} ms  rss={result['peak_rss_mb']:>7.1f} MB  {result['statuses']}") # One line per scenario
+                results.append(result) # Keep it for the JSON output
+    return {'commit': commit_id(), 'timestamp': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(), # Identify the run
+            'parameters': {key: value for key, value in vars(arguments).items() if key not in ('output', 'compare')}, 'results': results} # Options and measurements
+
+def compare(current:dict, previous:dict) -> None: # Function to print the change of throughput and p99 latency against a previous run
+    before = {result['scenario']: result for result in previous['results']} # Previous results by scenario
+    print(f"\ncompared with {previous.get('commit', '?')}:") # Header
+    for result in current['results']: # Every scenario of this run
+        old = before.get(result['scenario']) # Same scenario in the previous run
+        if old is None: continue # New scenario
+        print(f"{result['scenario']:<26} throughput x{result['requests_per_second'] / old['requests_per_second']:.2f}  p99 x{result['p99_ms'] / old['p99_ms'] if old['p99_ms'] else float('inf'):.2f}") # Ratios (above 1 is faster for throughput, slower for p99)
+
+if __name__ == '__main__': # Run as a command: python Benchmarks/Routes.py --users 100 --transactions 20000 --concurrency 16 --output run.json
+    parser = argparse.ArgumentParser(description='Throughput, latency percentiles and peak memory for every route, against a seeded temporary database') # Command line parser
+    parser.add_argument('--users', type=int, default=100) # Seeded users
+    parser.add_argument('--transactions', type=int, default=20000) # Seeded transactions
+    parser.add_argument('--requests', type=int, default=200) # Requests per route
+    parser.add_argument('--concurrency', type=int, default=16) # Clients sending requests at the same time
+    parser.add_argument('--bulk-rows', type=int, default=100) # Rows per bulk upload
+    parser.add_argument('--memory', action='store_true', help='Use an in-memory database instead of a temporary file') # In-memory database
+    parser.add_argument('--mode', default='async', choices=['async', 'sync']) # Database session mode
+    parser.add_argument('--coalesce', action='store_true', help='Enable the group commit writer') # Group commit mode
+    parser.add_argument('--flag-scan', action='store_true', help='Run the background flagging scan during the benchmark') # Background scan competing with the requests
+    parser.add_argument('--pool-size', type=int, default=5) # Connection pool size
+    parser.add_argument('--hasher', default='bcrypt', choices=['bcrypt', 'sha512']) # Password hasher
+    parser.add_argument('--bcrypt-rounds', type=int, default=12) # bcrypt cost factor
+    parser.add_argument('--hash-workers', type=int, default=4) # Password hashing pool size
+    parser.add_argument('--only', nargs='+', help='Only run the scenarios whose name contains one of these') # Scenario filter
+    parser.add_argument('--trace-memory', action='store_true', help='Also report the peak Python allocation of each scenario (slows the run)') # tracemalloc
+    parser.add_argument('--seed', type=int, default=0) # Random seed of the generated data
+    parser.add_argument('--output', help='Write the results to this JSON file') # JSON output
+    parser.add_argument('--compare', help='Print the change against the results in this JSON file') # Previous run
+    arguments = parser.parse_args() # Parse the options
+    report = asyncio.run(main(arguments)) # Run the benchmark
+    if arguments.output: # JSON output requested
+        with open(arguments.output, 'w') as file: json.dump(report, file, indent=2) # Write the results
+    if arguments.compare: # Comparison requested
+        with open(arguments.compare) as file: compare(report, json.load(file)) # Print the ratios
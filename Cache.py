@@ -0,0 +1,38 @@
+import time # Import time module to expire entries
+from collections import OrderedDict # Import ordered dictionary to keep entries in least-recently-used order
+from typing import Any, Hashable, Optional # Import the types of the cached keys and values
+
+
+class TTLCache: # Bounded least-recently-used cache whose entries also expire at a given time
+    def __init__(self, maxsize:int, ttl:Optional[float]=None): # Accept the most entries kept and the default lifetime in seconds (None keeps entries until evicted)
+        self.maxsize = maxsize # Most entries kept before the least recently used one is evicted
+        self.ttl = ttl # Default lifetime of an entry in seconds
+        self.entries:OrderedDict = OrderedDict() # key -> (value, expiry time), least recently used first
+        self.hits:int = 0 # Lookups answered from the cache
+        self.misses:int = 0 # Lookups that had to go to the source
+
+    def get(self, key:Hashable) -> Any: # Return the cached value or None when it is missing or expired
+        entry = self.entries.get(key) # Look the key up
+        if entry is not None and (entry[1] is None or entry[1] > time.time()): # Present and not expired
+            self.entries.move_to_end(key) # Mark it as the most recently used
+            self.hits += 1 # Count the hit
+            return entry[0] # Return the cached value
+        if entry is not None: del self.entries[key] # Drop the expired entry
+        self.misses += 1 # Count the miss
+        return None # The caller reads the source
+
+    def set(self, key:Hashable, value:Any, expires_at:Optional[float]=None) -> None: # Store a value until the expiry time passed (or for the default lifetime)
+        if expires_at is None and self.ttl is not None: expires_at = time.time() + self.ttl # Default lifetime
+        self.entries[key] = (value, expires_at) # Store the value
+        self.entries.move_to_end(key) # Mark it as the most recently used
+        while len(self.entries) > self.maxsize: self.entries.popitem(last=False) # Evict the least recently used entries
+
+    def invalidate(self, key:Hashable) -> None: self.entries.pop(key, None) # Remove a single entry (after the source changed)
+
+    def clear(self) -> None: # Remove every entry and reset the counters
+        self.entries.clear() # Remove every entry
+        self.hits = self.misses = 0 # Reset the counters
+
+    def statistics(self) -> dict: # Return the counters used to size the cache
+        lookups = self.hits + self.misses # Total number of lookups
+        return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / lookups if lookups else 0.0} # Current size, limit, and hit/miss counters
@@ -0,0 +1,58 @@
+import os # Import the OS module to read the configuration from environment variables
+from typing import Optional # Import Optional class for settings that may be left unset
+from pydantic import BaseModel, Field # Import BaseModel and Field classes for data validation
+
+
+class Settings(BaseModel): # Settings class that inherits from Base-Model to validate the configuration supplied by the deployment
+    secret_key: Optional[str] = Field(default=None, description='Key used to sign tokens, shared by every worker and host') # Signing key (a random per-process key is used when unset)
+    database_url: str = Field(default='sqlite:///./user.db', description='Link where the SQL database is located') # Link where the SQL database will be located
+    database_mode: str = Field(default='async', pattern='^(async|sync)$', description="'async' or the blocking 'sync' fallback") # Either 'async' (non-blocking driver) or 'sync' (blocking fallback kept for benchmarking)
+    pool_size: int = Field(default=5, ge=1, description='Connections kept open in the pool') # Number of connections kept open in the pool
+    max_overflow: int = Field(default=10, ge=0, description='Extra connections allowed during bursts') # Number of extra connections allowed above the pool size during bursts
+    pool_timeout: float = Field(default=30.0, gt=0, description='Seconds to wait for a free connection') # Seconds a request waits for a free connection before failing
+    create_schema: bool = Field(default=True, description='Create missing tables when the application starts') # Create the tables once at startup (disable when migrations are run separately)
+    sqlite_journal_mode: str = Field(default='WAL', pattern='^(DELETE|TRUNCATE|PERSIST|MEMORY|WAL|OFF)$', description='SQLite journal mode') # WAL lets readers run while a writer commits
+    sqlite_synchronous: str = Field(default='NORMAL', pattern='^(OFF|NORMAL|FULL|EXTRA)$', description='SQLite synchronous level') # NORMAL only syncs at WAL checkpoints, which is durable against application crashes
+    sqlite_busy_timeout_ms: int = Field(default=5000, ge=0, description='Milliseconds SQLite waits for a lock before failing') # Wait for the writer lock instead of failing immediately
+    write_coalescing: bool = Field(default=False, description='Commit concurrent transaction writes together from a single writer task') # Group commit mode
+    coalesce_window_ms: float = Field(default=2.0, ge=0, description='Milliseconds the writer waits for more writes before committing') # Length of the collection window
+    coalesce_max_batch: int = Field(default=64, ge=1, description='Most writes committed together') # Size limit of a group commit
+    token_cache_size: int = Field(default=10000, ge=1, description='Validated tokens kept in memory') # Entries of the token claims cache (each expires with its token)
+    user_cache_size: int = Field(default=10000, ge=1, description='User records kept in memory') # Entries of the user record cache
+    user_cache_ttl: float = Field(default=30.0, gt=0, description='Seconds a cached user record is trusted') # Bounds how long another worker can serve a record changed elsewhere
+    password_hasher: str = Field(default='bcrypt', pattern='^(bcrypt|sha512)$', description='Scheme used for new password hashes') # Legacy hashes are replaced with this scheme on the next successful login
+    bcrypt_rounds: int = Field(default=12, ge=4, le=31, description='bcrypt cost factor') # Each step doubles the work per login
+    hash_workers: int = Field(default=4, ge=1, description='Passwords hashed at the same time') # Size of the hashing pool (and of its concurrency limit)
+    hash_executor: str = Field(default='thread', pattern='^(thread|process)$', description='Run hashing on threads or processes') # bcrypt releases the GIL so threads are enough
+    query_threshold: int = Field(default=20, ge=0, description='Flag requests issuing more SQL statements than this') # Catches N+1 query patterns
+    slow_request_ms: Optional[float] = Field(default=None, gt=0, description='Log requests slower than this with the SQL they issued') # Slow-request log (disabled when unset)
+    analytics_refresh_seconds: float = Field(default=1.0, ge=0, description='Seconds the analytics snapshot is served before new transactions are looked for') # Repeated dashboard hits within this interval issue no query
+    analytics_rebuild_seconds: float = Field(default=300.0, gt=0, description='Seconds between full recomputations of the analytics snapshot') # Bounds how long updates and deletes made by another worker go unseen
+    flag_scan: bool = Field(default=False, description='Run the background scan that flags suspicious users') # Off by default: enable it on a single worker so several processes do not scan the same chunks
+    flag_scan_chunk: int = Field(default=500, ge=1, description='Transactions read per chunk of the flagging scan') # Bounds the length of each read and write transaction
+    flag_scan_pause_ms: float = Field(default=10.0, ge=0, description='Milliseconds the flagging scan yields between chunks') # Leaves the database to request traffic while catching up
+    flag_scan_interval: float = Field(default=5.0, gt=0, description='Seconds the flagging scan sleeps once it has caught up') # How soon new transactions are checked
+    flag_amount_threshold: float = Field(default=10000.0, ge=0, description='Flag the owner of any transaction of at least this amount (0 disables)') # Large transaction rule
+    flag_velocity_count: int = Field(default=50, ge=0, description='Flag users with more than this many transactions within the velocity window (0 disables)') # Velocity rule
+    flag_velocity_window: int = Field(default=100, ge=1, description='Consecutive transaction IDs the velocity rule looks at') # The Transaction table has no timestamp, so velocity is measured on the ID sequence
+    flag_mix_account_type: str = Field(default='Credit', pattern='^(Checking|Credit|Savings)$', description='Account type watched by the mix rule') # Account type whose share is checked
+    flag_mix_share: float = Field(default=0.9, ge=0, le=1, description='Flag users whose share of transactions on the watched account type exceeds this (0 disables)') # Unusual account type mix rule
+    flag_mix_min_count: int = Field(default=10, ge=1, description='Transactions a user needs before the mix rule applies') # Avoids flagging new users on their first transactions
+
+    @classmethod
+    def from_environment(cls) -> 'Settings': # Function to build the settings from environment variables
+        environment = { # Map each setting to the environment variable that supplies it
+            'secret_key': os.getenv('SECRET_KEY'), 'database_url': os.getenv('DATABASE_URL'), 'database_mode': os.getenv('DATABASE_MODE'), # Security and database link
+            'pool_size': os.getenv('DATABASE_POOL_SIZE'), 'max_overflow': os.getenv('DATABASE_MAX_OVERFLOW'), 'pool_timeout': os.getenv('DATABASE_POOL_TIMEOUT'), # Connection pool sizes
+            'create_schema': os.getenv('CREATE_SCHEMA'), # Startup behaviour
+            'sqlite_journal_mode': os.getenv('SQLITE_JOURNAL_MODE'), 'sqlite_synchronous': os.getenv('SQLITE_SYNCHRONOUS'), 'sqlite_busy_timeout_ms': os.getenv('SQLITE_BUSY_TIMEOUT_MS'), # SQLite pragmas
+            'write_coalescing': os.getenv('WRITE_COALESCING'), 'coalesce_window_ms': os.getenv('WRITE_COALESCE_WINDOW_MS'), 'coalesce_max_batch': os.getenv('WRITE_COALESCE_MAX_BATCH'), # Group commit mode
+            'token_cache_size': os.getenv('TOKEN_CACHE_SIZE'), 'user_cache_size': os.getenv('USER_CACHE_SIZE'), 'user_cache_ttl': os.getenv('USER_CACHE_TTL'), # Authentication caches
+            'password_hasher': os.getenv('PASSWORD_HASHER'), 'bcrypt_rounds': os.getenv('BCRYPT_ROUNDS'), 'hash_workers': os.getenv('HASH_WORKERS'), 'hash_executor': os.getenv('HASH_EXECUTOR'), # Password hashing
+            'query_threshold': os.getenv('QUERY_THRESHOLD'), 'slow_request_ms': os.getenv('SLOW_REQUEST_MS'), # Instrumentation
+            'analytics_refresh_seconds': os.getenv('ANALYTICS_REFRESH_SECONDS'), 'analytics_rebuild_seconds': os.getenv('ANALYTICS_REBUILD_SECONDS'), # Analytics snapshot
+            'flag_scan': os.getenv('FLAG_SCAN'), 'flag_scan_chunk': os.getenv('FLAG_SCAN_CHUNK'), 'flag_scan_pause_ms': os.getenv('FLAG_SCAN_PAUSE_MS'), 'flag_scan_interval': os.getenv('FLAG_SCAN_INTERVAL'), # Flagging scan
+            'flag_amount_threshold': os.getenv('FLAG_AMOUNT_THRESHOLD'), 'flag_velocity_count': os.getenv('FLAG_VELOCITY_COUNT'), 'flag_velocity_window': os.getenv('FLAG_VELOCITY_WINDOW'), # Flagging rules
+            'flag_mix_account_type': os.getenv('FLAG_MIX_ACCOUNT_TYPE'), 'flag_mix_share': os.getenv('FLAG_MIX_SHARE'), 'flag_mix_min_count': os.getenv('FLAG_MIX_MIN_COUNT')
+        }
+        return cls(**{name: value for name, value in environment.items() if value is not None}) # Only pass the variables that were set so the defaults apply to the rest
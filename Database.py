@@ -1,12 +1,89 @@
-from sqlalchemy import create_engine # Import the engine function to define the database engine
-from sqlalchemy.orm import sessionmaker # Import the session-maker function to establish a database session
+from typing import Annotated, AsyncIterator # Import Annotated class to establish dependencies and the iterator type returned by the dependency
+from fastapi import Depends # Import Depends class to declare the shared database dependency
+from sqlalchemy import create_engine, event # Import the engine function to define the database engine and the event module to configure new connections
+from sqlalchemy.orm import sessionmaker, Session # Import the session-maker function to establish a database session and the blocking Session class
+from sqlalchemy.pool import StaticPool, QueuePool, AsyncAdaptedQueuePool # Import the static pool used by in-memory databases and the bounded pools used by everything else
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession # Import the asynchronous engine, session-maker and session classes
 from sqlalchemy.ext.declarative import declarative_base # Import the base function to create the database
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert # Import the SQLite insert that supports ON CONFLICT
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert # Import the PostgreSQL insert that supports ON CONFLICT
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
 
 
-database_link:str = 'sqlite:///./user.db' # Link where the SQL database will be located
+def async_link(link:str) -> str: # Function to translate a blocking database link into its asynchronous driver equivalent
+    if link.startswith('sqlite://'): return link.replace('sqlite://', 'sqlite+aiosqlite://', 1) # SQLite is served by the aiosqlite driver
+    if link.startswith('postgresql://'): return link.replace('postgresql://', 'postgresql+asyncpg://', 1) # PostgreSQL is served by the asyncpg driver
+    return link # The link already names an asynchronous driver
 
-engine = create_engine(database_link, connect_args={'check_same_thread': False}) # Create the database engine at the link passed to arguments
-LocalSession = sessionmaker(autocommit=False, autoflush=False, bind=engine) # Establish a session between the database created and the server
+def apply_sqlite_pragmas(engine, settings:Settings) -> None: # Function to configure every new SQLite connection opened by the engine passed
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record): # Runs once per physical connection before it enters the pool
+        cursor = dbapi_connection.cursor() # Cursor on the raw driver connection
+        cursor.execute(f'PRAGMA journal_mode={settings.sqlite_journal_mode}') # Journal mode (WAL lets readers run while a writer commits)
+        cursor.execute(f'PRAGMA synchronous={settings.sqlite_synchronous}') # How often SQLite waits for the disk
+        cursor.execute(f'PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}') # Wait for the writer lock instead of failing with "database is locked"
+        cursor.close() # Release the cursor
+
+def pool_arguments(settings:Settings, pool_class=QueuePool) -> dict: # Function to build the connection pool arguments for the settings passed
+    link = settings.database_url # Link where the SQL database is located
+    if link.startswith('sqlite') and (':memory:' in link or link.rstrip('/').endswith(':')): # In-memory SQLite only exists inside a single connection
+        return {'poolclass': StaticPool} # Share one connection so every session sees the same database
+    return {'poolclass': pool_class, 'pool_size': settings.pool_size, 'max_overflow': settings.max_overflow, 'pool_timeout': settings.pool_timeout} # Bounded pool for file and server databases
+
+
+engine = None # Blocking database engine (created by configure_database)
+async_engine = None # Asynchronous database engine (created by configure_database)
+database_mode:str = 'async' # Either 'async' (non-blocking driver) or 'sync' (blocking fallback kept for benchmarking)
+LocalSession = sessionmaker(autocommit=False, autoflush=False) # Establish a session between the database created and the server (bound by configure_database)
+AsyncLocalSession = async_sessionmaker(autoflush=False, expire_on_commit=False) # Establish an asynchronous session that keeps loaded attributes readable after commit (bound by configure_database)
 Base = declarative_base() # Construct the base class required to create the database and tables in the database
 
+def configure_database(settings:Settings) -> None: # Function to (re)create the engines from the settings passed and bind the session-makers to them
+    global engine, async_engine, database_mode # The engines and mode are shared by every router through this module
+    if engine is not None: engine.dispose() # Release the connections held by the previous blocking engine
+    if async_engine is not None: async_engine.sync_engine.dispose() # Release the connections held by the previous asynchronous engine
+    connect_arguments:dict = {'check_same_thread': False} if settings.database_url.startswith('sqlite') else {} # SQLite connections are shared between threads by the pool
+    engine = create_engine(settings.database_url, connect_args=connect_arguments, **pool_arguments(settings)) # Create the database engine at the link passed to arguments
+    async_engine = create_async_engine(async_link(settings.database_url), connect_args=connect_arguments, **pool_arguments(settings, AsyncAdaptedQueuePool)) # Create the asynchronous database engine on the same database
+    if settings.database_url.startswith('sqlite'): # Pragmas only exist on SQLite
+        apply_sqlite_pragmas(engine, settings) # Configure the connections of the blocking engine
+        apply_sqlite_pragmas(async_engine.sync_engine, settings) # Configure the connections of the asynchronous engine
+    database_mode = settings.database_mode # Remember which kind of session the dependency hands out
+    LocalSession.configure(bind=engine) # Bind the blocking session-maker to the new engine
+    AsyncLocalSession.configure(bind=async_engine) # Bind the asynchronous session-maker to the new engine
+
+def ensure_database() -> None: # Function to create the engines from the environment when no application configured them (nothing is connected on import)
+    if engine is None: configure_database(Settings.from_environment()) # Default configuration so the module is usable without an application
+
+def upsert(table): # Function to return an insert on the table passed that supports on_conflict_do_update (None when the database has no such statement)
+    ensure_database() # The dialect is read from the engine
+    return {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}.get(engine.dialect.name, lambda table: None)(table) # Both engines point at the same database, so either one names the dialect
+
+
+class SyncSession: # Adapter that exposes the awaitable Async-Session interface on top of a blocking Session (sync fallback mode)
+    def __init__(self, session:Session): self.session = session # Store the blocking session that does the actual work
+
+    def add(self, instance) -> None: self.session.add(instance) # Add a record to the session
+    def add_all(self, instances) -> None: self.session.add_all(instances) # Add several records to the session
+    async def execute(self, statement, parameters=None): return self.session.execute(statement, parameters) # Execute a statement on the calling thread (blocks the event loop on purpose)
+    async def scalar(self, statement, parameters=None): return self.session.scalar(statement, parameters) # Execute a statement and return the first column of the first row
+    async def scalars(self, statement, parameters=None): return self.session.scalars(statement, parameters) # Execute a statement and return the first column of every row
+    async def get(self, entity, ident): return self.session.get(entity, ident) # Retrieve a record by its primary key
+    async def delete(self, instance) -> None: self.session.delete(instance) # Mark a record for deletion
+    async def flush(self) -> None: self.session.flush() # Send pending changes to the database without committing
+    async def commit(self) -> None: self.session.commit() # Commit changes to the database
+    async def rollback(self) -> None: self.session.rollback() # Discard changes made in the current transaction
+    async def close(self) -> None: self.session.close() # Return the connection to the pool
+
+
+def open_session() -> AsyncSession: # Function to open a session in the configured mode
+    ensure_database() # The session-makers are bound on first use when no application configured them
+    if database_mode == 'sync': return SyncSession(LocalSession()) # Blocking session wrapped to look asynchronous
+    else: return AsyncLocalSession() # Non-blocking session on the asynchronous engine
+
+async def get_database() -> AsyncIterator[AsyncSession]: # Shared dependency used by every router to establish a connection to the database
+    session = open_session() # Establish a session in the configured mode
+    try: yield session # Hold the connection using yield-keyword until the response is sent
+    finally: await session.close() # Close the connection once the response has been sent
 
+db_dependency = Annotated[AsyncSession, Depends(get_database)] # Dependency injection that waits for the Session is established by the function
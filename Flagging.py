@@ -0,0 +1,152 @@
+import asyncio # Import asyncio for the scan task and its pauses
+import logging # Import logging module to record why each user was flagged
+from collections import deque # Import double-ended queue to keep each user's recent transaction IDs
+from typing import Optional # Import Optional class for the scan that may be disabled
+from sqlalchemy import select, update, insert, func, type_coerce, String # Import the functions to build queries and to read Enum columns as plain strings
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+import Database # Import the database module to open the scan's session
+import Authentication # Import the authentication module whose user cache is invalidated when a user is flagged
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
+from Tables import User, Transaction, Balance, ScanState # Import the User, Transaction, Balance and scan progress tables
+from WriteQueue import run_write # Import the function that commits a write directly or through the group commit writer
+
+flag_log = logging.getLogger('bank.flagging') # Logger of the users flagged and of scan failures
+max_attempts:int = 3 # Consecutive failures of the same chunk before it is skipped
+
+
+def chunk_query(after_id:int, chunk:int): # Function to build the query that reads the next chunk of the scan in ID order
+    return select(Transaction.id, Transaction.owner_id, Transaction.amount).where(Transaction.id > after_id).order_by(Transaction.id).limit(chunk) # The rules never decode the account type, so a value outside the Enum cannot stop the scan
+
+
+class FlaggingScan: # Background task that reads the Transaction table in chunks from a persisted high-water mark and flags suspicious users
+    name:str = 'flagging' # Row of the ScanState table holding this scan's progress
+
+    def __init__(self, settings:Settings): # Accept the chunk size, pauses and rules
+        self.chunk = settings.flag_scan_chunk # Transactions read per chunk
+        self.pause = settings.flag_scan_pause_ms / 1000 # Seconds yielded between chunks while catching up
+        self.interval = settings.flag_scan_interval # Seconds slept once caught up
+        self.amount_threshold = settings.flag_amount_threshold # Transactions of at least this amount flag their owner (0 disables)
+        self.velocity_count = settings.flag_velocity_count # More transactions than this within the window flag their owner (0 disables)
+        self.velocity_window = settings.flag_velocity_window # Width of the window in transaction IDs
+        self.mix_account_type = settings.flag_mix_account_type # Account type watched by the mix rule
+        self.mix_share = settings.flag_mix_share # Share of the watched account type above which a user is flagged (0 disables)
+        self.mix_min_count = settings.flag_mix_min_count # Transactions a user needs before the mix rule applies
+        self.recent:dict[str, deque] = {} # owner -> IDs of their transactions inside the velocity window
+        self.stopping:asyncio.Event = asyncio.Event() # Set to stop the scan after the current chunk
+        self.task:Optional[asyncio.Task] = None # The scan task
+        self.scanned:int = 0 # Transactions processed
+        self.flagged:int = 0 # Users flagged
+        self.failures:int = 0 # Consecutive failures of the current chunk
+        self.skipped:int = 0 # Chunks skipped after failing repeatedly
+
+    def start(self) -> None: self.task = asyncio.create_task(self.run()) # Start the scan task on the running event loop
+
+    async def stop(self) -> None: # Stop the scan after the chunk in progress
+        self.stopping.set() # Ask the scan to stop
+        if self.task is not None: await self.task # Wait until the chunk in progress is committed
+
+    async def run(self) -> None: # Scan loop
+        while not self.stopping.is_set(): # Serve until asked to stop
+            try: # Try clause
+                processed = await self.scan_chunk() # Process the next chunk
+                self.failures = 0 # The chunk went through
+            except Exception: # The chunk failed (it is read again on the next pass since the high-water mark did not move)
+                self.failures += 1 # Count the consecutive failure
+                flag_log.exception('Flagging scan failed (attempt %d of %d); retrying in %.1f s', self.failures, max_attempts, self.interval) # Record the failure
+                processed = 0 # Wait a full interval before retrying
+                if self.failures >= max_attempts: # The chunk keeps failing, so it is not a transient error
+                    try: await self.skip_chunk() # Move the high-water mark past it so the scan carries on with the next rows
+                    except Exception: flag_log.exception('Flagging scan could not skip the failing chunk') # Retried on the next pass
+                    else: self.failures = 0 # Start counting again on the next chunk
+            try: await asyncio.wait_for(self.stopping.wait(), self.pause if processed == self.chunk else self.interval) # Short pause while catching up, long sleep once caught up
+            except asyncio.TimeoutError: pass # The pause ended without a stop request
+
+    async def scan_chunk(self) -> int: # Process the transactions after the high-water mark and return how many were read
+        session = Database.open_session() # The scan has its own session
+        try: # Try clause
+            last_id = await session.scalar(select(ScanState.last_id).where(ScanState.name == self.name)) # High-water mark (None before the first chunk)
+            rows = (await session.execute(chunk_query(last_id or 0, self.chunk))).all() # Next chunk in ID order
+            suspects = self.apply_rules(rows) # Owners caught by the amount and velocity rules
+            if rows and self.mix_share: # The mix rule is enabled
+                for owner_id, reason in (await self.check_mix(session, {row.owner_id for row in rows if row.owner_id is not None})).items(): suspects.setdefault(owner_id, reason) # Owners caught by the mix rule
+            await session.rollback() # End the read transaction before writing so no snapshot is held across the write
+            if not rows: return 0 # Caught up
+            high_water = rows[-1].id # Last transaction of the chunk
+
+            async def mark(db:AsyncSession) -> int: # Write operation that flags the suspects and moves the high-water mark in one short transaction
+                flagged = 0 # Users whose flag changed
+                if suspects: flagged = (await db.execute(update(User).where(User.username.in_(list(suspects))).where(User.flagged.is_not(True)).values(flagged=True))).rowcount # One batched update for the whole chunk
+                await self.advance(db, last_id, high_water) # Move the high-water mark past the chunk
+                return flagged # Return the number of users flagged
+
+            flagged = await run_write(session, mark) # Commit the chunk
+            for owner_id, reason in suspects.items(): # Every suspect of the chunk
+                Authentication.user_cache.invalidate(owner_id) # Cached records no longer show the right flag
+                flag_log.info('Flagged %s: %s', owner_id, reason) # Record why the user was flagged
+            self.scanned += len(rows) # Count the transactions processed
+            self.flagged += flagged # Count the users flagged
+            return len(rows) # Return the size of the chunk
+        finally: await session.close() # Return the connection to the pool
+
+    async def advance(self, db:AsyncSession, last_id:Optional[int], high_water:int) -> None: # Function to move the high-water mark forward inside the caller's transaction
+        statement = Database.upsert(ScanState) # INSERT ... ON CONFLICT on SQLite and PostgreSQL
+        if statement is not None: # Creating and moving the mark is one statement, so a second scanning process cannot fail on the first insert
+            statement = statement.values(name=self.name, last_id=high_water) # Create the high-water mark
+            await db.execute(statement.on_conflict_do_update(index_elements=[ScanState.name], set_={'last_id': statement.excluded.last_id}, where=ScanState.last_id < statement.excluded.last_id)) # Move it forward only
+        elif last_id is None: await db.execute(insert(ScanState).values(name=self.name, last_id=high_water)) # First chunk: create the high-water mark
+        else: await db.execute(update(ScanState).where(ScanState.name == self.name).where(ScanState.last_id < high_water).values(last_id=high_water)) # Move the high-water mark forward only
+
+    async def skip_chunk(self) -> None: # Move the high-water mark past the next chunk without applying the rules
+        session = Database.open_session() # The scan has its own session
+        try: # Try clause
+            last_id = await session.scalar(select(ScanState.last_id).where(ScanState.name == self.name)) # High-water mark (None before the first chunk)
+            chunk_ids = select(Transaction.id).where(Transaction.id > (last_id or 0)).order_by(Transaction.id).limit(self.chunk).subquery() # IDs of the failing chunk (only the primary key is read)
+            high_water = await session.scalar(select(func.max(chunk_ids.c.id))) # Last ID of the failing chunk
+            await session.rollback() # End the read transaction before writing
+            if high_water is None: return # Nothing left to skip
+            await run_write(session, lambda db: self.advance(db, last_id, high_water)) # Commit the new high-water mark
+            self.skipped += 1 # Count the skipped chunk
+            flag_log.error('Flagging scan skipped transactions %d to %d after %d failed attempts', (last_id or 0) + 1, high_water, max_attempts) # The skipped range has to be checked by hand
+        finally: await session.close() # Return the connection to the pool
+
+    def apply_rules(self, rows:list) -> dict[str, str]: # Function to apply the rules that only need the chunk itself
+        suspects:dict[str, str] = {} # owner -> reason of the first rule that caught them
+        for row in rows: # Every transaction of the chunk in ID order
+            if row.owner_id is None: continue # Transactions without an owner cannot flag anyone
+            if self.amount_threshold and row.amount is not None and row.amount >= self.amount_threshold: # Amount rule
+                suspects.setdefault(row.owner_id, f'transaction {row.id} of {row.amount} is at least {self.amount_threshold}') # Large transaction
+            if self.velocity_count: # Velocity rule
+                recent = self.recent.setdefault(row.owner_id, deque()) # Recent transactions of the owner
+                if not recent or recent[-1] < row.id: recent.append(row.id) # A chunk read again after a failure is not counted twice
+                while recent[0] <= row.id - self.velocity_window: recent.popleft() # Drop the transactions that left the window
+                if len(recent) > self.velocity_count: suspects.setdefault(row.owner_id, f'{len(recent)} of the last {self.velocity_window} transactions') # Too many transactions in the window
+        if rows: # Forget the owners with no transaction left in the window so memory stays bounded
+            for owner_id in [owner_id for owner_id, recent in self.recent.items() if recent[-1] <= rows[-1].id - self.velocity_window]: del self.recent[owner_id]
+        return suspects # Return the owners caught
+
+    async def check_mix(self, db:AsyncSession, owners:set[str]) -> dict[str, str]: # Function to apply the account type mix rule to the owners of a chunk
+        if not owners: return {} # Nothing to check
+        counts:dict[str, dict] = {} # owner -> account type -> number of transactions
+        for row in (await db.execute(select(Balance.owner_id, type_coerce(Balance.account_type, String).label('account_type'), Balance.count).where(Balance.owner_id.in_(owners)))).all(): # Maintained counts (no scan of the owners' transactions; account types read as plain strings)
+            counts.setdefault(row.owner_id, {})[row.account_type] = row.count # Count of the account type
+        suspects:dict[str, str] = {} # owner -> reason
+        for owner_id, by_type in counts.items(): # Every owner with balances
+            total = sum(by_type.values()) # Transactions of the owner
+            share = by_type.get(self.mix_account_type, 0) / total if total else 0.0 # Share on the watched account type
+            if total >= self.mix_min_count and share > self.mix_share: suspects[owner_id] = f'{share:.0%} of {total} transactions on {self.mix_account_type}' # Unusual mix
+        return suspects # Return the owners caught
+
+
+flagging_scan:Optional[FlaggingScan] = None # The running scan (None when it is disabled)
+
+def start_flagging_scan(settings:Settings) -> None: # Function to start the scan task when it is enabled
+    global flagging_scan # The scan is stopped by the application's shutdown step
+    if settings.flag_scan: # The scan was requested
+        flagging_scan = FlaggingScan(settings) # Scan configured with the rules
+        flagging_scan.start() # Start the scan task
+
+async def stop_flagging_scan() -> None: # Function to stop the scan task
+    global flagging_scan # The scan is stopped by the application's shutdown step
+    if flagging_scan is not None: # The scan is running
+        await flagging_scan.stop() # Let the chunk in progress commit
+        flagging_scan = None # Nothing left to stop
@@ -0,0 +1,78 @@
+import asyncio # Import asyncio to await hashing jobs and bound how many run at once
+import hmac # Import hmac module to compare digests in constant time
+from abc import ABC, abstractmethod # Import the abstract base class and decorator that define the hasher interface
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor # Import the executors that run hashing away from the event loop
+from hashlib import sha512 # Import SHA-512 hashing algorithm
+from typing import Optional # Import Optional class for a pool that may not be created yet
+import bcrypt # Import bcrypt key-derivation function
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
+
+
+class PasswordHasher(ABC): # Interface of a password hashing scheme (a scheme missing one of the abstract methods fails when it is created)
+    name:str = '' # Name used in the settings
+
+    @abstractmethod
+    def hash(self, password:str) -> str: ... # Return the stored form of the password
+    @abstractmethod
+    def verify(self, password:str, hashed:str) -> bool: ... # Return whether the password matches the stored hash
+    @abstractmethod
+    def identify(self, hashed:str) -> bool: ... # Return whether the stored hash was produced by this scheme
+    def needs_rehash(self, hashed:str) -> bool: return False # Return whether a hash of this scheme uses outdated parameters
+
+class SHA512Hasher(PasswordHasher): # Legacy scheme: unsalted SHA-512 hex digest
+    name = 'sha512' # Name used in the settings
+
+    def hash(self, password:str) -> str: return sha512(password.encode('utf-8')).digest().hex() # Use SHA-512 to hash the password and retrieve the hexadecimal version
+    def verify(self, password:str, hashed:str) -> bool: return hmac.compare_digest(self.hash(password), hashed) # Compare in constant time
+    def identify(self, hashed:str) -> bool: return len(hashed) == 128 and all(character in '0123456789abcdef' for character in hashed) # 64 bytes written as hexadecimal
+
+class BcryptHasher(PasswordHasher): # Salted, deliberately slow scheme
+    name = 'bcrypt' # Name used in the settings
+
+    def __init__(self, rounds:int=12): self.rounds = rounds # Cost factor (each step doubles the work)
+
+    def hash(self, password:str) -> str: return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('ascii') # Hash with a fresh salt
+    def verify(self, password:str, hashed:str) -> bool: return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('ascii')) # Re-hash with the stored salt and compare
+    def identify(self, hashed:str) -> bool: return hashed.startswith(('$2a$', '$2b$', '$2y$')) # Modular crypt format of bcrypt
+    def needs_rehash(self, hashed:str) -> bool: return int(hashed.split('$')[2]) != self.rounds # The cost factor changed since the hash was stored
+
+
+class HashingPool: # Runs a hasher on an executor so hashing never blocks the event loop
+    def __init__(self, hasher:PasswordHasher, workers:int=4, executor:str='thread'): # Accept the current hasher, the number of workers, and the kind of executor
+        self.hasher = hasher # Scheme used for new hashes
+        self.legacy:list[PasswordHasher] = [SHA512Hasher(), BcryptHasher()] # Schemes still accepted when verifying stored hashes
+        self.executor:Executor = ProcessPoolExecutor(workers) if executor == 'process' else ThreadPoolExecutor(workers, thread_name_prefix='hashing') # bcrypt releases the GIL so threads are enough; processes suit pure-Python hashers
+        self.limit = asyncio.Semaphore(workers) # Bound the jobs handed to the executor so a login burst waits here instead of growing its queue
+
+    async def run(self, function, *arguments): # Run a hashing function on the executor
+        async with self.limit: return await asyncio.get_running_loop().run_in_executor(self.executor, function, *arguments) # Wait for a free worker, then for the result
+
+    def scheme(self, hashed:str) -> Optional[PasswordHasher]: # Return the scheme that produced a stored hash
+        if self.hasher.identify(hashed): return self.hasher # Usually the current scheme
+        return next((hasher for hasher in self.legacy if hasher.identify(hashed)), None) # Otherwise a legacy scheme (None when unknown)
+
+    async def hash(self, password:str) -> str: return await self.run(self.hasher.hash, password) # Hash a password with the current scheme
+
+    async def verify(self, password:str, hashed:str) -> tuple[bool, bool]: # Return whether the password matches and whether the stored hash should be replaced
+        scheme = self.scheme(hashed) # Scheme that produced the stored hash
+        if scheme is None: return False, False # Unknown format never matches
+        matches = await self.run(scheme.verify, password, hashed) # Verify on the executor
+        outdated = scheme.name != self.hasher.name or scheme.needs_rehash(hashed) # Legacy scheme or outdated parameters
+        return matches, matches and outdated # Only rehash when the password is known to be correct
+
+    def shutdown(self) -> None: self.executor.shutdown(wait=False) # Stop the workers
+
+
+def create_hasher(name:str, bcrypt_rounds:int=12) -> PasswordHasher: # Function to build the hasher named in the settings
+    if name == 'sha512': return SHA512Hasher() # Legacy scheme
+    else: return BcryptHasher(bcrypt_rounds) # Default scheme
+
+password_pool:HashingPool = HashingPool(BcryptHasher()) # Pool used by the routers (replaced by configure_hashing)
+
+def configure_hashing(settings:Settings) -> None: # Function to build the pool from the settings
+    global password_pool # The pool is shared by every router through this module
+    password_pool.shutdown() # Stop the workers of the previous pool
+    password_pool = HashingPool(create_hasher(settings.password_hasher, settings.bcrypt_rounds), settings.hash_workers, settings.hash_executor) # New pool with the configured scheme and size
+
+async def hash_password(password:str) -> str: return await password_pool.hash(password) # Hash a password off the event loop
+async def verify_password(password:str, hashed:str) -> tuple[bool, bool]: return await password_pool.verify(password, hashed) # Verify a password off the event loop
@@ -0,0 +1,96 @@
+import csv # Import CSV module to parse uploaded CSV rows
+import json # Import JSON module to parse uploaded JSON and NDJSON rows
+from collections import defaultdict # Import default dictionary to sum the balance changes of a batch
+from typing import AsyncIterator, Union # Import the iterator types produced while reading an upload
+from pydantic import BaseModel, ValidationError # Import BaseModel class for the row schema and the error raised by invalid rows
+from fastapi import Request # Import Request class to read the raw (possibly streamed) upload
+from sqlalchemy import insert # Import the insert function to build the batched INSERT statement
+from sqlalchemy.exc import SQLAlchemyError # Import the base class of database errors
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+from Tables import Transaction # Import the Transaction table
+from Balances import apply_delta # Import the function that maintains the per-user balances
+
+
+class UnsupportedUpload(ValueError): pass # Raised when the upload is not a JSON array, NDJSON or CSV
+
+def decode_line(line:bytes, encoding:str='utf-8') -> Union[str, UnicodeDecodeError]: # Function to decode one line, returning the error instead of raising it
+    try: return line.decode(encoding).rstrip('\r') # Lines are UTF-8 text
+    except UnicodeDecodeError as error: return error # Reported for this line only
+
+async def read_lines(chunks:AsyncIterator[bytes]) -> AsyncIterator[Union[str, UnicodeDecodeError]]: # Generator that splits a streamed body into lines without reading it whole (a line that is not UTF-8 is yielded as its decoding error)
+    buffer = b'' # Bytes received after the last complete line
+    encoding = 'utf-8-sig' # The first line drops the byte order mark some editors and spreadsheets write
+    async for chunk in chunks: # Read the body as it arrives
+        buffer += chunk # Append the chunk to the incomplete line
+        *lines, buffer = buffer.split(b'\n') # Every piece but the last ends with a newline
+        for line in lines: # Every complete line
+            yield decode_line(line, encoding) # Yield the line
+            encoding = 'utf-8' # A byte order mark is only valid at the start of the body
+    if buffer: yield decode_line(buffer, encoding) # The last line may not end with a newline
+
+async def read_rows(request:Request) -> AsyncIterator[tuple[int, Union[dict, Exception]]]: # Generator that yields (row number, row or parsing error) for every row of the upload
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower() # Media type without parameters such as charset
+    if content_type == 'application/json': # A JSON array cannot be parsed incrementally so it is read whole
+        try: rows = json.loads(await request.body()) # Parse the array
+        except ValueError as error: raise UnsupportedUpload(f'Invalid JSON: {error}') # The whole body is unusable (malformed JSON or bytes that are not UTF-8)
+        if not isinstance(rows, list): raise UnsupportedUpload('Expected a JSON array of transactions') # A single object is not a bulk upload
+        for number, row in enumerate(rows, start=1): yield number, row # Yield each element of the array
+    elif content_type in ('application/x-ndjson', 'application/jsonl'): # One JSON object per line, read as it streams in
+        number = 0 # Number of the current row
+        async for line in read_lines(request.stream()): # Read the body line by line
+            if isinstance(line, str) and not line.strip(): continue # Skip blank lines
+            number += 1 # Count the row
+            if isinstance(line, Exception): yield number, line; continue # Report the line that is not UTF-8 without aborting the upload
+            try: yield number, json.loads(line) # Parse the line
+            except json.JSONDecodeError as error: yield number, error # Report the line without aborting the upload
+    elif content_type == 'text/csv': # Header line followed by one transaction per line, read as it streams in
+        header = None # Column names taken from the first line
+        number = 0 # Number of the current data row
+        async for line in read_lines(request.stream()): # Read the body line by line
+            if isinstance(line, Exception): # The line is not UTF-8
+                if header is None: raise UnsupportedUpload(f'Invalid CSV header: {line}') # Without column names no row can be read
+                number += 1 # Count the row
+                yield number, line; continue # Report the line without aborting the upload
+            if not line.strip(): continue # Skip blank lines
+            values = next(csv.reader([line])) # Parse the line with the CSV quoting rules
+            if header is None: header = [name.strip() for name in values]; continue # The first line names the columns
+            number += 1 # Count the row
+            yield number, dict(zip(header, values)) # Pair each value with its column name
+    else: raise UnsupportedUpload(f'Unsupported content type {content_type!r}; use application/json, application/x-ndjson or text/csv') # Unknown upload format
+
+
+async def write_batch(db:AsyncSession, owner_id:str, batch:list[dict]) -> None: # Function to insert a batch of validated rows and update the balances in one database transaction
+    await db.execute(insert(Transaction), batch) # A list of parameter sets runs as a single executemany
+    totals:dict = defaultdict(lambda: [0.0, 0]) # Sum of the amounts and count of the rows per account type
+    for row in batch: # Aggregate the batch so each balance is updated once
+        totals[row['account_type']][0] += row['amount'] # Add the amount
+        totals[row['account_type']][1] += 1 # Count the transaction
+    for account_type, (amount, count) in totals.items(): await apply_delta(db, owner_id, account_type, amount, count) # Update the user's balances in the same database transaction
+    await db.commit() # Commit the batch to the database
+
+async def ingest(db:AsyncSession, owner_id:str, rows:AsyncIterator[tuple[int, Union[dict, Exception]]], schema:type[BaseModel], batch_size:int) -> dict: # Function to validate and insert every row, committing once per batch
+    inserted:int = 0 # Number of rows written to the database
+    errors:list[dict] = [] # Errors of the rows that were rejected
+    batch:list[dict] = [] # Validated rows waiting to be inserted
+    numbers:list[int] = [] # Row numbers of the rows in the batch (to report a failed batch)
+
+    async def flush() -> None: # Write the pending batch and record the outcome
+        nonlocal inserted # Counter shared with the enclosing function
+        try: # Try clause
+            await write_batch(db, owner_id, batch) # Insert the batch and update the balances
+            inserted += len(batch) # Count the rows written
+        except SQLAlchemyError as error: # The database rejected the batch
+            await db.rollback() # Discard the partial batch so the session can be used for the next one
+            errors.extend({'row': number, 'detail': f'Batch rejected by the database: {error.__class__.__name__}'} for number in numbers) # Report every row of the batch
+        batch.clear() # Start a new batch
+        numbers.clear() # Start a new batch
+
+    async for number, row in rows: # Read the upload row by row
+        if isinstance(row, Exception): errors.append({'row': number, 'detail': str(row)}); continue # The row could not be parsed
+        try: transaction = schema.model_validate(row) # Apply the same validation rules as a single transaction
+        except ValidationError as error: errors.append({'row': number, 'detail': error.errors(include_url=False, include_context=False, include_input=False)}); continue # Report the invalid row and keep going
+        batch.append({'amount': transaction.amount, 'account_type': transaction.account_type, 'owner_id': owner_id}) # Queue the row for insertion
+        numbers.append(number) # Remember its row number
+        if len(batch) >= batch_size: await flush() # Commit once per batch instead of once per row
+    if batch: await flush() # Write the last, partial batch
+    return {'inserted': inserted, 'errors': errors} # Return the number of rows written and the rows that were rejected
@@ -0,0 +1,132 @@
+import logging # Import logging module to write the slow-request log
+import time # Import time module to measure request and statement durations
+from bisect import bisect_left # Import binary search to find the bucket of an observation
+from collections import defaultdict # Import default dictionary to create series on first use
+from contextvars import ContextVar # Import context variable to attribute statements to the request that issued them
+from typing import Optional # Import Optional class for settings that may be left unset
+from fastapi import APIRouter # Import the router class to expose the metrics route
+from fastapi.responses import PlainTextResponse # Import the plain text response used by the Prometheus text format
+from sqlalchemy import event # Import the event module to hook into statement execution
+
+slow_log = logging.getLogger('bank.slow_requests') # Logger of the slow-request log and of requests issuing too many queries
+latency_buckets:tuple = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Upper bounds (seconds) of the latency histograms
+query_buckets:tuple = (0, 1, 2, 3, 5, 10, 20, 50, 100) # Upper bounds of the queries-per-request histogram
+
+
+class Histogram: # Cumulative histogram in the Prometheus format
+    def __init__(self, buckets:tuple): # Accept the upper bounds of the buckets
+        self.buckets = buckets # Upper bounds in increasing order
+        self.counts:list[int] = [0] * (len(buckets) + 1) # Observations per bucket (the last one is +Inf)
+        self.sum:float = 0.0 # Sum of the observations
+        self.count:int = 0 # Number of observations
+
+    def observe(self, value:float) -> None: # Record one observation
+        self.counts[bisect_left(self.buckets, value)] += 1 # Count it in the first bucket whose bound is not below it
+        self.sum += value # Add it to the sum
+        self.count += 1 # Count it
+
+class RequestState: # Statements issued while serving one request
+    def __init__(self, capture:bool): # Accept whether the statements themselves are kept for the slow-request log
+        self.queries:int = 0 # Number of statements executed
+        self.statements:Optional[list] = [] if capture else None # (duration, statement) pairs kept for the slow-request log
+
+current_request:ContextVar[Optional[RequestState]] = ContextVar('current_request', default=None) # Request being served by the current task
+
+
+class Registry: # All the series exposed on the metrics route
+    def __init__(self): # Create empty series
+        self.request_latency:dict = defaultdict(lambda: Histogram(latency_buckets)) # (method, route) -> request duration
+        self.request_status:dict = defaultdict(int) # (method, route, status) -> number of responses
+        self.request_queries:dict = defaultdict(lambda: Histogram(query_buckets)) # (method, route) -> statements per request
+        self.query_heavy:dict = defaultdict(int) # (method, route) -> requests above the query threshold
+        self.statement_latency:dict = defaultdict(lambda: Histogram(latency_buckets)) # operation -> statement duration
+        self.query_threshold:int = 20 # Requests issuing more statements than this are flagged
+        self.slow_request_seconds:Optional[float] = None # Requests slower than this are logged with their statements (None disables the log)
+
+    def render(self) -> str: # Return every series in the Prometheus text format
+        lines:list[str] = [] # Output lines
+        def histogram(name:str, description:str, series:dict, label_names:tuple) -> None: # Append one histogram family
+            lines.extend([f'# HELP {name} {description}', f'# TYPE {name} histogram']) # Family header
+            for key, values in sorted(series.items()): # Every label combination
+                labels = ','.join(f'{label}="{escape(value)}"' for label, value in zip(label_names, key)) # Label pairs
+                cumulative = 0 # Observations at or below the current bound
+                for bound, count in zip(values.buckets + ('+Inf',), values.counts): # Every bucket
+                    cumulative += count # Buckets are cumulative in the text format
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}') # Bucket line
+                lines.extend([f'{name}_sum{{{labels}}} {values.sum}', f'{name}_count{{{labels}}} {values.count}']) # Sum and count lines
+        def counter(name:str, description:str, series:dict, label_names:tuple) -> None: # Append one counter family
+            lines.extend([f'# HELP {name} {description}', f'# TYPE {name} counter']) # Family header
+            for key, value in sorted(series.items()): # Every label combination
+                lines.append(f'{name}{{' + ','.join(f'{label}="{escape(item)}"' for label, item in zip(label_names, key)) + f'}} {value}') # Counter line
+        histogram('bank_http_request_duration_seconds', 'Time spent serving each route', self.request_latency, ('method', 'route')) # Request latency
+        counter('bank_http_responses_total', 'Responses sent per route and status code', self.request_status, ('method', 'route', 'status')) # Status codes
+        histogram('bank_http_request_queries', 'SQL statements issued per request', self.request_queries, ('method', 'route')) # Statements per request
+        counter('bank_http_query_heavy_requests_total', 'Requests that issued more SQL statements than the threshold', self.query_heavy, ('method', 'route')) # Flagged requests
+        histogram('bank_sql_statement_duration_seconds', 'Time spent executing SQL statements', self.statement_latency, ('operation',)) # Statement latency
+        return '\n'.join(lines) + '\n' # The text format ends with a newline
+
+def escape(value) -> str: return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') # Escape a label value
+
+registry:Registry = Registry() # Series of this process (each worker exposes its own)
+
+def configure_metrics(query_threshold:int, slow_request_ms:Optional[float]) -> None: # Function to set the query threshold and the slow-request log threshold
+    registry.query_threshold = query_threshold # Requests issuing more statements than this are flagged
+    registry.slow_request_seconds = None if slow_request_ms is None else slow_request_ms / 1000 # Threshold is configured in milliseconds
+
+
+def instrument_engine(engine) -> None: # Function to time every statement executed by the (blocking) engine passed
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany): # Runs just before the driver executes a statement
+        connection.info.setdefault('statement_started', []).append(time.perf_counter()) # Stack of start times (statements may nest)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany): # Runs just after the driver executed a statement
+        duration = time.perf_counter() - connection.info['statement_started'].pop() # Time spent in the driver
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER' # SELECT, INSERT, UPDATE, DELETE, ...
+        registry.statement_latency[(operation,)].observe(duration) # Record the statement latency
+        state = current_request.get() # Request that issued the statement (None for background work)
+        if state is not None: # Issued while serving a request
+            state.queries += 1 # Count the statement
+            if state.statements is not None: state.statements.append((duration, statement)) # Keep it for the slow-request log
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context): # Runs when a statement fails (after_cursor_execute is skipped)
+        if context.connection is not None and context.connection.info.get('statement_started'): context.connection.info['statement_started'].pop() # Drop the start time of the failed statement
+
+
+class MetricsMiddleware: # ASGI middleware that records the latency, status code and statement count of every request
+    def __init__(self, app): self.app = app # Wrap the application
+
+    async def __call__(self, scope, receive, send): # Serve one connection
+        if scope['type'] != 'http': return await self.app(scope, receive, send) # Only HTTP requests are measured
+        state = RequestState(capture=registry.slow_request_seconds is not None) # Statements of this request
+        token = current_request.set(state) # Attribute the statements of this task to the request
+        status_code = 500 # Reported when the application fails before sending a response
+
+        async def send_wrapper(message): # Capture the status code on its way out
+            nonlocal status_code # Status shared with the enclosing function
+            if message['type'] == 'http.response.start': status_code = message['status'] # First message of the response
+            await send(message) # Pass the message on
+
+        started = time.perf_counter() # Start of the request
+        try: await self.app(scope, receive, send_wrapper) # Serve the request
+        finally: # Record the request even when it failed
+            duration = time.perf_counter() - started # Time spent serving the request
+            current_request.reset(token) # Stop attributing statements to the request
+            route = scope.get('route') # Route matched by the router (absent when nothing matched)
+            key = (scope['method'], getattr(route, 'path', '<unmatched>')) # Route template keeps the number of series bounded
+            registry.request_latency[key].observe(duration) # Record the latency
+            registry.request_status[key + (str(status_code),)] += 1 # Count the status code
+            registry.request_queries[key].observe(state.queries) # Record the number of statements
+            if state.queries > registry.query_threshold: # The request issued too many statements (N+1 pattern)
+                registry.query_heavy[key] += 1 # Count it
+                slow_log.warning('%s %s issued %d SQL statements (threshold %d)', key[0], key[1], state.queries, registry.query_threshold) # Flag it in the log
+            if registry.slow_request_seconds is not None and duration > registry.slow_request_seconds: # The request was slow
+                statements = '\n'.join(f'  {seconds * 1000:.2f} ms  {statement}' for seconds, statement in state.statements or []) # Statements it issued with their durations
+                slow_log.warning('%s %s took %.1f ms with %d SQL statements\n%s', key[0], key[1], duration * 1000, state.queries, statements) # Write it to the slow-request log
+
+
+metrics_router:APIRouter = APIRouter(tags=['Metrics']) # API Router instance to establish a path between this module and the main file
+
+@metrics_router.get('/metrics', response_class=PlainTextResponse) # GET Request to retrieve the metrics of this worker in the Prometheus text format
+async def metrics(): return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4') # Render every series
@@ -0,0 +1,38 @@
+import orjson # Import the fast JSON serializer to encode each streamed row
+from typing import AsyncIterator, Optional # Import iterator type returned by the stream and Optional class for filters that may be left unset
+from sqlalchemy import select, Select # Import the select function and the Select class to build queries
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+import Database # Import the database module to open sessions for streamed responses
+from Tables import Transaction # Import the Transaction table
+
+
+account_type_pattern:str = '^(Checking|Credit|Savings)$' # Account types accepted by the filters (matches the Enum on the Transaction table)
+transaction_columns = (Transaction.id, Transaction.amount, Transaction.account_type, Transaction.owner_id) # Columns returned by the listings
+
+def transaction_query(owner_id:Optional[str]=None, account_type:Optional[str]=None, # Function to build a listing query ordered by ID for keyset pagination
+                      min_id:Optional[int]=None, max_id:Optional[int]=None, after_id:int=0) -> Select:
+    statement = select(*transaction_columns).where(Transaction.id > after_id).order_by(Transaction.id) # Keyset condition on the primary key so every page is an index range scan
+    if owner_id is not None: statement = statement.where(Transaction.owner_id == owner_id) # Restrict to the transactions of one user
+    if account_type is not None: statement = statement.where(Transaction.account_type == account_type) # Restrict to one account type
+    if min_id is not None: statement = statement.where(Transaction.id >= min_id) # Lower bound of the ID range
+    if max_id is not None: statement = statement.where(Transaction.id <= max_id) # Upper bound of the ID range
+    return statement # Return the query without a limit so callers choose the page size
+
+async def read_page(db:AsyncSession, statement:Select, limit:int) -> dict: # Function to read a single page and the cursor of the next one
+    rows = (await db.execute(statement.limit(limit + 1))).all() # Read one extra row to learn whether another page exists
+    transactions = [row._asdict() for row in rows[:limit]] # Convert the rows of the page into dictionaries
+    next_after_id = transactions[-1]['id'] if len(rows) > limit else None # The last ID of the page is the cursor of the next page
+    return {'transactions': transactions, 'next_after_id': next_after_id} # Return the page and the cursor (None on the last page)
+
+async def stream_ndjson(chunk_size:int, **filters) -> AsyncIterator[bytes]: # Generator that yields the matching transactions as newline-delimited JSON, one chunk at a time
+    session = Database.open_session() # The request's session is closed before a streamed body is sent, so the stream opens its own
+    after_id:int = filters.pop('after_id', 0) # Start after the cursor passed (0 streams from the beginning)
+    try: # Try clause
+        while True: # Read chunks until the last one is shorter than the chunk size
+            rows = (await session.execute(transaction_query(after_id=after_id, **filters).limit(chunk_size))).all() # Read the next chunk by keyset
+            await session.rollback() # End the read transaction between chunks so no lock is held while the client reads
+            if not rows: break # No more transactions to send
+            yield b''.join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows) # Serialize the chunk as one JSON object per line (straight to bytes)
+            if len(rows) < chunk_size: break # The chunk was the last one
+            after_id = rows[-1].id # Continue after the last ID sent
+    finally: await session.close() # Close the connection once the stream has finished or the client disconnected
@@ -0,0 +1,62 @@
+from typing import Optional # Import Optional class for columns that may be empty
+from pydantic import BaseModel # Import BaseModel class for data validation
+
+
+class UserResponse(BaseModel): # Public columns of a User record (the hashed password and SSN are never returned)
+    username: str # Primary key of the User table
+    first_name: Optional[str] = None # First name of the user
+    last_name: Optional[str] = None # Last name of the user
+    email: Optional[str] = None # Email of the user
+    role: Optional[str] = None # Admin or User
+    flagged: Optional[bool] = None # Set by the flagging scan
+
+user_columns:tuple = tuple(UserResponse.model_fields) # Columns loaded by the queries that return users
+
+class FlaggedUserPage(BaseModel): # One page of the flagged users listing
+    users: list[UserResponse] # Flagged users of the page in username order
+    next_after: Optional[str] = None # Cursor of the next page (None on the last page)
+
+
+class TransactionResponse(BaseModel): # Columns of a Transaction record
+    id: int # Transaction ID
+    amount: float # Amount of the transaction
+    account_type: Optional[str] = None # Checking, Credit or Savings
+    owner_id: Optional[str] = None # Username of the owner
+
+class TransactionPage(BaseModel): # One page of a keyset-paginated listing
+    transactions: list[TransactionResponse] # Transactions of the page in ID order
+    next_after_id: Optional[int] = None # Cursor of the next page (None on the last page)
+
+
+class BalanceResponse(BaseModel): # Balance of one account type of a user
+    account_type: str # Checking, Credit or Savings
+    total: float # Sum of the amounts
+    count: int # Number of transactions
+
+
+class OwnerTotal(BaseModel): # Totals of one owner across every account type
+    owner_id: str # Username of the owner
+    total: float # Sum of the amounts
+    count: int # Number of transactions
+
+class AmountBucket(BaseModel): # One bucket of the amount histogram
+    le: str # Upper bound of the bucket ('+Inf' for the last one)
+    count: int # Transactions in the bucket (not cumulative)
+
+class AmountDistribution(BaseModel): # Distribution of the transaction amounts
+    count: int # Number of transactions
+    minimum: Optional[float] = None # Smallest amount (None when there are no transactions)
+    maximum: Optional[float] = None # Largest amount
+    mean: Optional[float] = None # Average amount
+    buckets: list[AmountBucket] # Histogram of the amounts
+    percentiles: dict[str, Optional[float]] # p50, p90, p95 and p99 estimated from the histogram
+
+class AnalyticsReport(BaseModel): # Portfolio report across every user
+    last_transaction_id: int # Last transaction included in the report
+    transactions: int # Number of transactions
+    total: float # Sum of the amounts
+    account_types: list[BalanceResponse] # Totals and counts per account type
+    owner_count: int # Number of owners with transactions
+    top_owners: list[OwnerTotal] # Owners with the largest totals
+    owner_totals: Optional[list[OwnerTotal]] = None # Every owner, largest total first (only when requested)
+    amounts: AmountDistribution # Distribution of the amounts
@@ -1,5 +1,5 @@
 from Database import Base # Import the base class that created the database
-from sqlalchemy import Column, String, Boolean, Float, Integer, ForeignKey, Enum # Import the Column class to define columns in table, its data types, and class to establish relationships between tables
+from sqlalchemy import Column, String, Boolean, Float, Integer, ForeignKey, Enum, Index # Import the Column class to define columns in table, its data types, class to establish relationships between tables, and class to define composite indexes
 
 
 class User(Base): # Parent-User table that inherits from the Base class used to construct the database itself
@@ -13,10 +13,28 @@ class User(Base): # Parent-User table that inherits from the Base class used to
     SSN = Column(String, unique=True, index=True) # Column to store user's SSN that is indexable and unique
     role = Column(Enum('Admin', 'User'), default='User') # A column to store role of the user created and it can only be an admin or user
 
+    __table_args__ = (Index('ix_User_flagged_username', 'flagged', 'username'),) # Composite index so flagged users are listed by keyset (flagged, username) without scanning every user
+
 
 class Transaction(Base): # Child-Transaction table that inherits from the Base class used to construct the database itself
     __tablename__ = "Transaction" # Name of the table
     id = Column(Integer, primary_key=True, index=True, autoincrement=True) # Column that represents transaction ID uniquely because it increments automatically as new records are added and is the primary key to identify each row
     amount = Column(Float, default=0.0) # Column to store balance of each user
     account_type = Column(Enum('Checking', 'Credit', 'Savings')) # Column to store account type which only accepts three values defined in the Enum type
-    owner_id = Column(String, ForeignKey("User.username")) # Column that references primary key of User's database table (Foreign Key) to link two tables together, allowing to identify which user performed the transaction
\ No newline at end of file
+    owner_id = Column(String, ForeignKey("User.username")) # Column that references primary key of User's database table (Foreign Key) to link two tables together, allowing to identify which user performed the transaction
+
+    __table_args__ = (Index('ix_Transaction_owner_id_id', 'owner_id', 'id'),) # Composite index so a user's transactions are read by keyset (owner, ID) without scanning other users' rows
+
+
+class Balance(Base): # Aggregate table that holds the running total of each user's account type, maintained alongside the Transaction table
+    __tablename__ = "Balance" # Name of the table
+    owner_id = Column(String, ForeignKey("User.username"), primary_key=True) # Column that references primary key of User's database table (first half of the composite primary key)
+    account_type = Column(Enum('Checking', 'Credit', 'Savings'), primary_key=True) # Column to store the account type (second half of the composite primary key)
+    total = Column(Float, default=0.0, nullable=False) # Column to store the sum of the amounts of the user's transactions on this account type
+    count = Column(Integer, default=0, nullable=False) # Column to store the number of the user's transactions on this account type
+
+
+class ScanState(Base): # Progress of the background scans over the Transaction table, kept across restarts
+    __tablename__ = "ScanState" # Name of the table
+    name = Column(String, primary_key=True) # Column to store the name of the scan
+    last_id = Column(Integer, default=0, nullable=False) # Column to store the last transaction ID the scan has processed (its high-water mark)
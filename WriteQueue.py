@@ -0,0 +1,101 @@
+import asyncio # Import asyncio for the writer task, its queue and the callers' futures
+from typing import Any, Awaitable, Callable, Optional # Import the types of the queued write operations
+from sqlalchemy.ext.asyncio import AsyncSession # Import Async-Session class to establish a non-blocking session between database and server
+import Database # Import the database module to open the writer's session
+from Configuration import Settings # Import the settings class that holds the externally supplied configuration
+
+Operation = Callable[[AsyncSession], Awaitable[Any]] # A write operation receives a session, makes its changes without committing, and returns its result
+
+
+class WriteQueue: # Group commit: a single writer task collects concurrent writes and commits them together
+    def __init__(self, window:float, max_batch:int): # Accept the collection window (seconds) and the most writes per commit
+        self.window = window # Seconds the writer waits for more writes after the first one arrives
+        self.max_batch = max_batch # Most writes committed together
+        self.queue:asyncio.Queue = asyncio.Queue() # Pending (operation, future) pairs (None asks the writer to stop)
+        self.task:Optional[asyncio.Task] = None # The writer task
+        self.commits:int = 0 # Number of group commits (exposed to size the window)
+        self.writes:int = 0 # Number of writes committed
+
+    def start(self) -> None: self.task = asyncio.create_task(self.run()) # Start the writer task on the running event loop
+
+    async def stop(self) -> None: # Commit the writes still queued and stop the writer task
+        await self.queue.put(None) # Ask the writer to stop after the writes already queued
+        if self.task is not None: await self.task # Wait until they are committed
+
+    async def submit(self, operation:Operation) -> Any: # Queue a write and wait until it has been committed
+        future = asyncio.get_running_loop().create_future() # Resolved by the writer with the operation's result or error
+        await self.queue.put((operation, future)) # Hand the operation to the writer
+        return await future # Wait for the group commit that includes it
+
+    async def run(self) -> None: # Writer loop
+        loop = asyncio.get_running_loop() # Loop used to measure the collection window
+        while True: # Serve until asked to stop
+            item = await self.queue.get() # Wait for the first write of the next group
+            if item is None: return # Asked to stop and nothing is pending
+            batch:list = [item] # Writes committed together
+            deadline = loop.time() + self.window # End of the collection window
+            stopping = False # Whether the stop request arrived during the window
+            while len(batch) < self.max_batch: # Collect more writes until the group is full
+                try: item = self.queue.get_nowait() if self.queue.qsize() else await asyncio.wait_for(self.queue.get(), deadline - loop.time()) # Take queued writes immediately, otherwise wait until the window closes
+                except asyncio.TimeoutError: break # The window closed
+                if item is None: stopping = True; break # Commit what was collected, then stop
+                batch.append(item) # Add the write to the group
+                if loop.time() >= deadline: break # The window closed while writes kept arriving
+            try: await self.commit(batch) # Commit the group
+            except Exception as error: # The commit failed outside the replay (e.g. rollback or close raised), which would otherwise end the writer task
+                for operation, future in batch: # Every write of the group
+                    if not future.done(): future.set_exception(error) # Fail the callers still waiting instead of leaving them hanging
+            if stopping: return # Stop after the last group
+
+    async def commit(self, batch:list) -> None: # Run every operation of the group in one database transaction
+        session = Database.open_session() # The writer has its own session
+        try: # Try clause
+            try: # Run the whole group in one transaction
+                results:list = [] # Result of each write
+                for operation, future in batch: # Apply every write
+                    results.append(await operation(session)) # Apply the write
+                    await session.flush() # Send it to the database so the next write of the group sees it
+                await session.commit() # One commit (and one fsync) for the whole group
+            except Exception: # One of the writes failed, which rolls back the whole group
+                await session.rollback() # Discard the group
+                await self.replay(session, batch) # Run the writes one by one so only the failing one is rejected
+                return # Every future was resolved by the replay
+            self.commits += 1 # Count the group commit
+            self.writes += len(batch) # Count the writes it contained
+            for (operation, future), result in zip(batch, results): # Resolve every caller with its own result
+                if not future.done(): future.set_result(result) # The caller may have been cancelled
+        finally: await session.close() # Return the connection to the pool
+
+    async def replay(self, session:AsyncSession, batch:list) -> None: # Commit each write of a failed group on its own
+        for operation, future in batch: # Every write of the group
+            try: # Try clause
+                result = await operation(session) # Apply the write
+                await session.commit() # Commit it on its own
+            except Exception as error: # This write is the one (or one of those) that failed
+                await session.rollback() # Discard it
+                if not future.done(): future.set_exception(error) # Raise the error in the caller
+            else: # The write was committed
+                self.commits += 1 # Count the commit
+                self.writes += 1 # Count the write
+                if not future.done(): future.set_result(result) # Resolve the caller
+
+
+write_queue:Optional[WriteQueue] = None # The running write queue (None when group commit is disabled)
+
+def start_write_queue(settings:Settings) -> None: # Function to start the writer task when group commit is enabled
+    global write_queue # The queue is shared by every router through this module
+    if settings.write_coalescing: # Group commit mode was requested
+        write_queue = WriteQueue(settings.coalesce_window_ms / 1000, settings.coalesce_max_batch) # Window is configured in milliseconds
+        write_queue.start() # Start the writer task
+
+async def stop_write_queue() -> None: # Function to commit the pending writes and stop the writer task
+    global write_queue # The queue is shared by every router through this module
+    if write_queue is not None: # Group commit mode is running
+        await write_queue.stop() # Commit what is still queued
+        write_queue = None # Later writes commit on their own session
+
+async def run_write(db:AsyncSession, operation:Operation) -> Any: # Function used by the routers to apply a write in the configured mode
+    if write_queue is not None: return await write_queue.submit(operation) # Group commit: the writer task applies and commits the write
+    result = await operation(db) # Apply the write on the request's session
+    await db.commit() # Commit changes to the database
+    return result # Return the operation's result